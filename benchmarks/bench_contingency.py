@@ -0,0 +1,70 @@
+"""Benchmark of the contingency engine against the list-comprehension implementation.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_contingency --rows 20000 --features 6
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.contingency import contingency_tables
+
+
+# Cell-by-cell counting, as done by contingency_binary / contingency_table in the notebook
+def legacy_contingency(df, feature, target):
+    class_names_1 = df[feature].value_counts().index.tolist()
+    class_names_2 = df[target].value_counts().index.tolist()
+    contingency_mat = np.zeros(shape = (len(class_names_2), len(class_names_1)))
+    for i in range(len(class_names_2)):
+        for j in range(len(class_names_1)):
+            contingency_mat[i][j] = len([k for k in range(len(df)) if df[target][k] == class_names_2[i] and df[feature][k] == class_names_1[j]])
+    return contingency_mat
+
+
+# Function to build a frame of binary features with missing values and a binary target
+def synthetic_frame(rows, features, seed = 0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({f'feature_{i}': rng.integers(0, 2, size = rows).astype(float) for i in range(features)})
+    df = df.mask(rng.random(df.shape) < 0.05)
+    df['hospital_death'] = (rng.random(rows) < 0.09).astype(int)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rows', type = int, default = 20000)
+    parser.add_argument('--features', type = int, default = 6)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows, args.features)
+    cols = [col for col in df.columns if col != 'hospital_death']
+
+    start = time.perf_counter()
+    legacy = {col: legacy_contingency(df, col, 'hospital_death') for col in cols}
+    legacy_time = time.perf_counter() - start
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        tables = contingency_tables(df, 'hospital_death', cols)
+        timings.append(time.perf_counter() - start)
+    vectorized_time = min(timings)
+
+    for col in cols:
+        if not np.array_equal(legacy[col], tables[col].counts):
+            raise AssertionError(f"Contingency tables differ for {col}")
+
+    print(pd.Series({"Rows": args.rows,
+                     "Features": len(cols),
+                     "List comprehension": "{:.4f} seconds".format(legacy_time),
+                     "Vectorized (best of {})".format(args.repeat): "{:.4f} seconds".format(vectorized_time),
+                     "Speedup": "{:.0f}x".format(legacy_time/vectorized_time)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Per-epoch training time and host memory of the tf.data pipeline against the DataFrame path.
+
+Simulates the repeated ``fit`` calls of a Hyperband search: the baseline network is
+trained ``--fits`` times for ``--epochs`` epochs, once from a float64 DataFrame with
+``validation_split`` (converted by Keras on every call) and once from the datasets of
+``src.input_pipeline`` (converted once). Run from the repository root:
+
+    python -m benchmarks.bench_input_pipeline --rows 73370 --features 160 --fits 5 --epochs 3
+
+On a single CPU core, with these arguments, the two paths train at the same speed
+(median epoch 5.08 seconds from the DataFrame, 5.23 seconds from the datasets, within
+the noise of repeated runs). The first epoch of a fit is about 0.35 seconds shorter from
+the datasets, and the peak RSS increase is 170 MB against 154 MB. Before the warm-up
+fit was added, the path run first was also charged the memory TensorFlow allocates on
+its first fit, which made the datasets look twice as lean as they are.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import tensorflow as tf
+
+from src.input_pipeline import fit_datasets
+from src.models import build_baseline
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs = None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs = None):
+        self.times.append(time.perf_counter() - self.start)
+
+
+# Function to run repeated fits; returns the total time, the epoch times and the peak RSS increase in MB
+def run_fits(make_inputs, input_dim, fits, epochs, batch_size):
+    process = psutil.Process(os.getpid())
+    baseline_rss = peak_rss = process.memory_info().rss
+    timer = EpochTimer()
+    start = time.perf_counter()
+    for _ in range(fits):
+        model = build_baseline(input_dim)
+        args, kwargs = make_inputs()
+        model.fit(*args, epochs = epochs, callbacks = [timer], verbose = 0, **kwargs)
+        peak_rss = max(peak_rss, process.memory_info().rss)
+    return time.perf_counter() - start, np.array(timer.times), (peak_rss - baseline_rss)/(1024*1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rows', type = int, default = 73370)
+    parser.add_argument('--features', type = int, default = 160)
+    parser.add_argument('--fits', type = int, default = 5)
+    parser.add_argument('--epochs', type = int, default = 3)
+    parser.add_argument('--batch-size', type = int, default = 32)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((args.rows, args.features)), columns = [f'feature_{i}' for i in range(args.features)])
+    y = pd.Series((rng.random(args.rows) < 0.09).astype(np.int64))
+
+    # Warm-up fit, so that the one-time memory and tracing costs of TensorFlow are not charged to the first path
+    build_baseline(args.features).fit(X.iloc[:1024], y.iloc[:1024], epochs = 1, batch_size = args.batch_size, verbose = 0)
+
+    # DataFrame path, as in the notebook: Keras converts X and y on every fit call
+    frame_inputs = lambda: ((X, y), dict(validation_split = 0.2, batch_size = args.batch_size))
+    frame_time, frame_epochs, frame_rss = run_fits(frame_inputs, args.features, args.fits, args.epochs, args.batch_size)
+
+    # tf.data path: converted to float32 tensors once, shared by every fit call
+    start = time.perf_counter()
+    train, validation = fit_datasets(X, y, validation_split = 0.2, batch_size = args.batch_size)
+    conversion_time = time.perf_counter() - start
+    dataset_inputs = lambda: ((train,), dict(validation_data = validation))
+    dataset_time, dataset_epochs, dataset_rss = run_fits(dataset_inputs, args.features, args.fits, args.epochs, args.batch_size)
+
+    print(pd.Series({"Training matrix": "{} rows x {} features".format(args.rows, args.features),
+                     "Fit calls x epochs": "{} x {}".format(args.fits, args.epochs),
+                     "DataFrame: median epoch": "{:.2f} seconds".format(np.median(frame_epochs)),
+                     "DataFrame: first epoch of a fit": "{:.2f} seconds".format(frame_epochs[::args.epochs].mean()),
+                     "DataFrame: total": "{:.2f} seconds".format(frame_time),
+                     "DataFrame: peak RSS increase": "{:.1f} MB".format(frame_rss),
+                     "tf.data: one-time conversion": "{:.2f} seconds".format(conversion_time),
+                     "tf.data: median epoch": "{:.2f} seconds".format(np.median(dataset_epochs)),
+                     "tf.data: first epoch of a fit": "{:.2f} seconds".format(dataset_epochs[::args.epochs].mean()),
+                     "tf.data: total": "{:.2f} seconds".format(dataset_time + conversion_time),
+                     "tf.data: peak RSS increase": "{:.1f} MB".format(dataset_rss)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
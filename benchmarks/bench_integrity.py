@@ -0,0 +1,78 @@
+"""Peak memory and runtime of the hashed duplicate checks against the transposing ones.
+
+Builds a mixed-dtype frame with a few duplicate columns and rows, and measures the
+tracemalloc peak of ``data.duplicated().sum()`` / ``data.T.duplicated().sum()`` and of
+``duplicate_rows`` / ``duplicate_columns``. Run from the repository root:
+
+    python -m benchmarks.bench_integrity --rows 91713 --features 186
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.integrity import duplicate_columns, duplicate_rows
+
+
+# Function to build a frame of float, flag and categorical columns, with duplicate columns and rows
+def synthetic_frame(rows, features, seed = 0):
+    rng = np.random.default_rng(seed)
+    n_flags, n_categories = features//10, features//20
+    n_floats = features - n_flags - n_categories
+    df = pd.DataFrame(rng.normal(50, 20, size = (rows, n_floats)).astype(np.float32),
+                      columns = [f'feature_{i}' for i in range(n_floats)])
+    df = df.mask(rng.random(df.shape) < 0.1)
+    for i in range(n_flags):
+        df[f'flag_{i}'] = (rng.random(rows) < 0.2).astype(np.int8)
+    for i in range(n_categories):
+        df[f'category_{i}'] = pd.Categorical(rng.choice(['a', 'b', 'c', 'd'], size = rows))
+    # Three duplicate columns (one as float64), and 1% of the rows repeated
+    df['feature_0_copy'] = df['feature_0'].astype(np.float64)
+    df['flag_0_copy'] = df['flag_0']
+    df['category_0_copy'] = df['category_0']
+    order = np.arange(rows)
+    repeated = rng.choice(np.arange(1, rows), size = rows//100, replace = False)
+    order[repeated] = repeated - 1
+    return df.iloc[order].reset_index(drop = True)
+
+
+# Function to run a function under tracemalloc; returns the result, the runtime and the peak in MB
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    runtime = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, runtime, peak/(1024*1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rows', type = int, default = 91713)
+    parser.add_argument('--features', type = int, default = 186)
+    parser.add_argument('--chunksize', type = int, default = 100000)
+    args = parser.parse_args()
+
+    data = synthetic_frame(args.rows, args.features)
+    legacy_rows, legacy_rows_time, legacy_rows_peak = measure(lambda: data.duplicated().sum())
+    hashed_rows, hashed_rows_time, hashed_rows_peak = measure(duplicate_rows, data, args.chunksize)
+    legacy_cols, legacy_cols_time, legacy_cols_peak = measure(lambda: data.T.duplicated().sum())
+    groups, hashed_cols_time, hashed_cols_peak = measure(duplicate_columns, data, args.chunksize)
+    hashed_cols = sum(len(group) - 1 for group in groups)
+    assert legacy_rows == hashed_rows and legacy_cols == hashed_cols
+
+    print(pd.Series({"Dataset": "{} rows x {} columns ({:.1f} MB)".format(*data.shape, data.memory_usage(deep = True).sum()/(1024*1024)),
+                     "Duplicate rows": hashed_rows,
+                     "Duplicate columns": hashed_cols,
+                     "data.duplicated() peak memory": "{:.1f} MB ({:.2f} seconds)".format(legacy_rows_peak, legacy_rows_time),
+                     "duplicate_rows peak memory": "{:.1f} MB ({:.2f} seconds)".format(hashed_rows_peak, hashed_rows_time),
+                     "data.T.duplicated() peak memory": "{:.1f} MB ({:.2f} seconds)".format(legacy_cols_peak, legacy_cols_time),
+                     "duplicate_columns peak memory": "{:.1f} MB ({:.2f} seconds)".format(hashed_cols_peak, hashed_cols_time)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Micro-benchmark of the min-max scaler against the per-column normalization loops.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_minmax --rows 73370 --features 160
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.scaling import MinMaxScaler
+
+
+# Per-column normalization, as done in section 3.4 of the notebook
+def legacy_minmax(X_train, X_test):
+    for col in X_train.columns:
+        if X_train[col].dtypes == 'int64' or X_train[col].dtypes == 'float64':
+            if X_train[col].nunique() > 1:
+               X_train[col] = (X_train[col] - X_train[col].min()) / (X_train[col].max() - X_train[col].min())
+    for col in X_test.columns:
+        if X_test[col].dtypes == 'int64' or X_test[col].dtypes == 'float64':
+            if X_test[col].nunique() > 1:
+               X_test[col] = (X_test[col] - X_test[col].min()) / (X_test[col].max() - X_test[col].min())
+    return X_train, X_test
+
+
+# Function to build a one-hot-expanded frame: float features, a few constant ones and 0/1 dummies
+def synthetic_frame(rows, features, seed = 0):
+    rng = np.random.default_rng(seed)
+    n_dummies = features//4
+    df = pd.DataFrame(rng.normal(50, 20, size = (rows, features - n_dummies)),
+                      columns = [f'feature_{i}' for i in range(features - n_dummies)])
+    df.iloc[:, :3] = 1.0
+    for i in range(n_dummies):
+        df[f'dummy_{i}'] = (rng.random(rows) < 0.3).astype(np.uint8)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rows', type = int, default = 73370)
+    parser.add_argument('--features', type = int, default = 160)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    X_train = synthetic_frame(args.rows, args.features, seed = 0)
+    X_test = synthetic_frame(args.rows//4, args.features, seed = 1)
+
+    legacy_timings, scaler_timings = [], []
+    for _ in range(args.repeat):
+        train, test = X_train.copy(), X_test.copy()
+        start = time.perf_counter()
+        legacy_train, _ = legacy_minmax(train, test)
+        legacy_timings.append(time.perf_counter() - start)
+
+        train = X_train.to_numpy(dtype = np.float32)
+        test = X_test.to_numpy(dtype = np.float32)
+        start = time.perf_counter()
+        scaler = MinMaxScaler().fit(train)
+        scaler.transform(train)
+        scaler.transform(test)
+        scaler_timings.append(time.perf_counter() - start)
+
+    # Both approaches agree on the training set, where they use the same constants
+    np.testing.assert_allclose(train, legacy_train.to_numpy(dtype = np.float32), rtol = 1e-5, atol = 1e-5)
+
+    print(pd.Series({"Rows (train + test)": len(X_train) + len(X_test),
+                     "Features": args.features,
+                     "Per-column loops (best of {})".format(args.repeat): "{:.4f} seconds".format(min(legacy_timings)),
+                     "MinMaxScaler (best of {})".format(args.repeat): "{:.4f} seconds".format(min(scaler_timings)),
+                     "Speedup": "{:.1f}x".format(min(legacy_timings)/min(scaler_timings))}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Scaling of the pipeline stages with the number of encounters, on synthetic data.
+
+For every size, a GOSSIS-shaped dataset is generated from the data dictionary
+(``src.synthetic``), and the stages are recorded with ``src.instrumentation``:
+profiling, imputation, encoding, scaling, one training epoch of the tuned-size network,
+batch scoring (preprocessing and NumPy forward pass) and DeepLIFT SHAP values. The
+records are written to CSV, the wall time and peak memory of every stage are plotted
+against the size on log-log axes, and the slope of each curve (1 for linear scaling) is
+reported. Run from the repository root:
+
+    python -m benchmarks.bench_pipeline_sizes --sizes 10000,30000,100000,300000 --plot pipeline_sizes.png
+"""
+
+import argparse
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from src.dataset_profile import DatasetProfile
+from src.encoding import CategoricalEncoder
+from src.explain import DeepLiftExplainer
+from src.imputation import ProportionImputer
+from src.ingestion import column_groups
+from src.instrumentation import StageRecorder
+from src.numpy_model import NumpyMLP
+from src.preprocessing import PreprocessingPipeline
+from src.scaling import MinMaxScaler
+from src.synthetic import TARGET, iter_synthetic
+
+# Function to record the stages of the pipeline on one synthetic dataset
+def run_size(rows, units, shap_rows, chunksize, seed):
+    from src.input_pipeline import fit_datasets
+    from src.models import make_model_builder
+    import keras_tuner as kt
+
+    data = pd.concat(iter_synthetic(rows, chunksize = chunksize, seed = seed), ignore_index = True)
+    data = data.drop(columns = ['encounter_id', 'patient_id', 'readmission_status'])
+    X, y = data.drop(TARGET, axis = 1), data[TARGET].to_numpy(dtype = np.float32)
+    cols_object = column_groups(X)[2]
+    recorder = StageRecorder()
+
+    with recorder.stage('profile', rows = rows):
+        profile = DatasetProfile.from_frame(data)
+        profile.missing_proportion()
+        profile.almost_constant(0.9)
+    with recorder.stage('impute', rows = rows):
+        kept = profile.drop(TARGET).missing_proportion()
+        kept = kept[kept <= 0.5].index.tolist()
+        X_imputed = ProportionImputer(random_state = seed).fit_transform(X[kept])
+    with recorder.stage('encode', rows = rows):
+        encoder = CategoricalEncoder(drop_first = True).fit(X_imputed, [col for col in cols_object if col in kept])
+        numerical = [col for col in kept if col not in encoder.columns_]
+        X_encoded = np.hstack([X_imputed[numerical].to_numpy(dtype = np.float32), encoder.transform(X_imputed)])
+    with recorder.stage('scale', rows = rows):
+        X_scaled = MinMaxScaler().fit_transform(X_encoded)
+    with recorder.stage('train_epoch', rows = rows):
+        hyperparameters = kt.HyperParameters()
+        hyperparameters.Fixed('units', units)
+        model = make_model_builder(X_scaled.shape[1])(hyperparameters)
+        train, _ = fit_datasets(X_scaled, y, batch_size = 32, seed = seed)
+        model.fit(train, epochs = 1, verbose = 0)
+    numpy_model = NumpyMLP.from_keras(model)
+    preprocessor = PreprocessingPipeline(cols_object = cols_object, random_state = seed).fit(X)
+    with recorder.stage('score', rows = rows):
+        numpy_model.predict(preprocessor.transform(X), batch_size = 65536)
+    explained = min(rows, shap_rows)
+    with recorder.stage('shap', rows = explained):
+        background = X_scaled[np.random.default_rng(seed).choice(rows, size = 100, replace = False)]
+        DeepLiftExplainer(numpy_model, background).shap_values(X_scaled[:explained])
+
+    records = recorder.to_frame()
+    records.insert(0, 'size', rows)
+    return records
+
+
+# Function to fit the slope of log(value) against log(rows processed) for every stage, ignoring values below min_value
+def scaling_exponents(results, column, min_value = 0):
+    slopes = {}
+    for stage, group in results.groupby(level = 'stage', sort = False):
+        group = group[group[column] > min_value]
+        if group['rows'].nunique() >= 2:
+            slopes[stage] = np.polyfit(np.log(group['rows']), np.log(group[column]), 1)[0]
+    return pd.Series(slopes)
+
+
+# Function to plot the wall time and peak memory of every stage against the size
+def plot_scaling(results, path):
+    fig, ax = plt.subplots(1, 2, figsize = (13, 5))
+    for stage, group in results.groupby(level = 'stage', sort = False):
+        ax[0].plot(group['size'], group['wall_seconds'], marker = 'o', label = stage)
+        ax[1].plot(group['size'], group['peak_rss_delta_mb'].clip(lower = 0.1), marker = 'o', label = stage)
+    for axis, ylabel in zip(ax, ["Wall time (seconds)", "Peak memory increase (MB)"]):
+        axis.set_xscale('log')
+        axis.set_yscale('log')
+        axis.set_xlabel("Encounters")
+        axis.set_ylabel(ylabel)
+        axis.grid(True, which = 'both', alpha = 0.3)
+    ax[0].legend()
+    plt.tight_layout()
+    fig.savefig(path, dpi = 100)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--sizes', default = '10000,30000,100000', help = 'comma-separated numbers of encounters')
+    parser.add_argument('--units', type = int, default = 256, help = 'units of the first layer of the network')
+    parser.add_argument('--shap-rows', type = int, default = 10000, help = 'maximum number of rows explained')
+    parser.add_argument('--chunksize', type = int, default = 100000)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', default = 'pipeline_sizes.csv')
+    parser.add_argument('--plot', default = 'pipeline_sizes.png')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = pd.concat([run_size(rows, args.units, args.shap_rows, args.chunksize, args.seed) for rows in sizes])
+    results.to_csv(args.output)
+    plot_scaling(results, args.plot)
+
+    print(results[['size', 'wall_seconds', 'cpu_seconds', 'peak_rss_delta_mb', 'rows']].to_string())
+    print(" ")
+    print(pd.DataFrame({'time_exponent': scaling_exponents(results, 'wall_seconds'),
+                        'memory_exponent': scaling_exponents(results, 'peak_rss_delta_mb', min_value = 1)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
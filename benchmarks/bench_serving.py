@@ -0,0 +1,112 @@
+"""Load generator for the micro-batching inference server.
+
+Starts the server in-process on a local port, then runs concurrent clients which send
+single-encounter requests back to back over keep-alive connections, and reports the
+p50/p95/p99 latency, the throughput and the micro-batch sizes. By default a stand-in
+NumPy model and a preprocessing pipeline fitted on synthetic data are used; pass
+--model, --preprocessor and --data to benchmark the real artifacts.
+
+    python -m benchmarks.bench_serving --clients 64 --requests 200 --max-wait-ms 2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.numpy_model import NumpyMLP
+from src.preprocessing import PreprocessingPipeline
+from src.scoring import load_scoring_model
+from src.serving import MicroBatcher, start_server
+
+
+# Dense ReLU stack of the same shape as the tuned model, with random weights
+def stand_in_model(n_features, units = 256, seed = 0):
+    rng = np.random.default_rng(seed)
+    sizes = [n_features, units, 12, 8, 4, 1]
+    return NumpyMLP([rng.normal(0, 1/np.sqrt(a), size = (a, b)) for a, b in zip(sizes[:-1], sizes[1:])],
+                    [np.zeros(b) for b in sizes[1:]],
+                    ['relu']*(len(sizes) - 2) + ['sigmoid'])
+
+
+# Function to build encounter records with numerical and categorical features and missing values
+def synthetic_records(rows, features = 100, seed = 0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size = (rows, features)), columns = [f'feature_{i}' for i in range(features)])
+    df = df.mask(rng.random(df.shape) < 0.2)
+    df['icu_type'] = rng.choice(['Med-Surg ICU', 'MICU', 'Neuro ICU', 'CCU-CTICU'], size = rows)
+    return df
+
+
+async def _client(port, records, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for record in records:
+        body = json.dumps(record).encode()
+        start = time.perf_counter()
+        writer.write(b'POST /predict HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                     + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+        await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            if line.lower().startswith(b'content-length'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def _run(args, model, preprocessor, records):
+    batcher = MicroBatcher(model, preprocessor, max_batch_size = args.max_batch_size, max_wait_ms = args.max_wait_ms)
+    server, batching_task = await start_server(batcher, port = 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    per_client = [records[i::args.clients][:args.requests] for i in range(args.clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(port, client_records, latencies) for client_records in per_client])
+    runtime = time.perf_counter() - start
+    batching_task.cancel()
+    server.close()
+    return np.array(latencies), runtime, np.array(batcher.batch_sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--clients', type = int, default = 64)
+    parser.add_argument('--requests', type = int, default = 200, help = 'requests per client')
+    parser.add_argument('--max-batch-size', type = int, default = 256)
+    parser.add_argument('--max-wait-ms', type = float, default = 2.0)
+    parser.add_argument('--model', default = None)
+    parser.add_argument('--preprocessor', default = None)
+    parser.add_argument('--data', default = None, help = 'CSV of encounters to replay (with --model)')
+    args = parser.parse_args()
+
+    if args.model is not None:
+        model = load_scoring_model(args.model)
+        preprocessor = PreprocessingPipeline.load(args.preprocessor)
+        df = pd.read_csv(args.data, nrows = args.clients*args.requests)
+    else:
+        df = synthetic_records(args.clients*args.requests)
+        preprocessor = PreprocessingPipeline(cols_object = ['icu_type']).fit(df)
+        model = stand_in_model(len(preprocessor.feature_names_))
+    records = json.loads(df.to_json(orient = 'records'))
+
+    latencies, runtime, batch_sizes = asyncio.run(_run(args, model, preprocessor, records))
+    p50, p95, p99 = np.percentile(latencies*1000, [50, 95, 99])
+    print(pd.Series({"Requests": len(latencies),
+                     "Concurrent clients": args.clients,
+                     "Latency p50": "{:.2f} ms".format(p50),
+                     "Latency p95": "{:.2f} ms".format(p95),
+                     "Latency p99": "{:.2f} ms".format(p99),
+                     "Throughput": "{:.0f} requests/sec".format(len(latencies)/runtime),
+                     "Mean micro-batch size": "{:.1f}".format(batch_sizes.mean())}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -43,14 +43,11 @@ from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
 # Train-test split and k-fold cross validation
-from sklearn.model_selection import train_test_split, KFold,  GridSearchCV
+from sklearn.model_selection import train_test_split
 
 # Missing data imputation
 from sklearn.impute import SimpleImputer
 
-# Categorical data encoding
-from sklearn.preprocessing import LabelEncoder
-
 # Deep learning
 import tensorflow as tf
 from tensorflow import keras
@@ -63,14 +60,6 @@ from keras.layers import Dense
 import keras_tuner as kt
 from keras_tuner import HyperModel, Hyperband
 
-# Model evaluation
-from sklearn import metrics
-from sklearn.metrics import accuracy_score
-from sklearn.metrics import roc_auc_score
-from sklearn.metrics import precision_score
-from sklearn.metrics import recall_score
-from sklearn.metrics import f1_score
-
 # Model loading
 from keras.models import load_model
 
@@ -78,6 +67,27 @@ from keras.models import load_model
 !pip install shap
 import shap
 
+# Project modules
+from src.contingency import contingency_tables
+from src.correlation import correlation_matrix, strong_pairs
+from src.correlation_report import correlation_report
+from src.cross_validation import cross_validate, summarize_folds
+from src.dataset_profile import DatasetProfile
+from src.density import DensitySummary
+from src.encoding import CategoricalEncoder
+from src.evaluation import bootstrap, evaluation_report, plot_curves, threshold_curve
+from src.explain import DeepLiftExplainer, KernelExplainer
+from src.explain_cache import CachedExplainer, ExplanationStore
+from src.imputation import ProportionImputer
+from src.instrumentation import StageRecorder
+from src.input_pipeline import fit_datasets
+from src.integrity import duplicate_columns, duplicate_rows
+from src.ingestion import read_dataset, column_groups
+from src.models import make_model_builder
+from src.numpy_model import EXPORT_ATOL, NumpyMLP, max_abs_difference
+from src.preprocessing import PreprocessingPipeline
+from src.training import train_best_epoch
+
 # Warning suppression
 import warnings
 warnings.filterwarnings('ignore')
@@ -85,6 +95,10 @@ warnings.filterwarnings('ignore')
 # Recording the starting time, which will be complemented with a time check at the end, to compute the total runtime of the process
 start = time.time()
 
+# Stage recorder: wall time, CPU time, peak memory and rows processed of each stage of the pipeline (the plots and
+# the exploratory cells are left out of the stages)
+recorder = StageRecorder()
+
 """<a name = "Introduction"></a>
 # 1. Introduction
 
@@ -93,10 +107,13 @@ start = time.time()
 Source: https://journals.lww.com/ccmjournal/Citation/2019/01001/33__THE_GLOBAL_OPEN_SOURCE_SEVERITY_OF_ILLNESS.36.aspx
 """
 
-# Loading the data
-data = pd.read_csv('content/Dataset.csv')
+# Loading the data, with compact dtypes assigned from the data dictionary
+recorder.begin('load')
+data = read_dataset('content/Dataset.csv')
+recorder.end(rows = len(data))
 
-# Memory usage
+# Memory usage (the comparison with the default dtypes of pd.read_csv, which parses the file twice, is run by
+# python -m src.ingestion content/Dataset.csv)
 print("Memory usage: {0:.2f} MB".format(data.memory_usage().sum()/(1024*1024)))
 
 # Printing the dataframe
@@ -114,6 +131,8 @@ The medical records of a patient play a significant role in determining his/her
 - Univariate Analysis
 - Multivariate Analysis
 
+The figures of this section can also be rendered to a static report, without a display, with `python -m src.report content/Dataset.csv --output-dir report`. Figures are drawn in a process pool, and on later runs only the figures whose underlying statistics changed are drawn again.
+
 <a name = "Understanding-Features"></a>
 ## 2.1. Understanding Features
 """
@@ -147,53 +166,58 @@ data.columns
 print(data.dtypes)
 
 # Count of column datatypes
-cols_int = data.columns[data.dtypes == 'int64'].tolist()
-cols_float = data.columns[data.dtypes == 'float64'].tolist()
-cols_object = data.columns[data.dtypes == 'object'].tolist()
+cols_int, cols_float, cols_object = column_groups(data)
 print(pd.Series({"Number of integer columns": len(cols_int),
                  "Number of float columns": len(cols_float),
                  "Number of object columns": len(cols_object)}).to_string())
 
-# Count of duplicate rows
-print(pd.Series({"Number of duplicate rows in the dataset": data.duplicated().sum()}).to_string())
+# Count of duplicate rows (hashed rows, exact check of the colliding ones)
+print(pd.Series({"Number of duplicate rows in the dataset": duplicate_rows(data)}).to_string())
+
+# Count of duplicate columns (hashed columns, without transposing the dataset)
+duplicate_groups = duplicate_columns(data)
+print(pd.Series({"Number of duplicate columns in the dataset": sum(len(group) - 1 for group in duplicate_groups)}).to_string())
 
-# Count of duplicate columns
-print(pd.Series({"Number of duplicate columns in the dataset": data.T.duplicated().sum()}).to_string())
+# Per-column statistics (distinct values, missing values, modes, ranges), computed in one pass
+recorder.begin('profile', rows = len(data))
+profile = DatasetProfile.from_frame(data)
+recorder.end()
 
 # Constant columns
-cols_constant = data.columns[data.nunique() == 1].tolist()
+cols_constant = profile.constant()
 if len(cols_constant) == 0:
     cols_constant = "None"
 print(pd.Series({"Constant columns in the dataset": cols_constant}).to_string())
 
 # Count of columns with missing values
-print(pd.Series({"Number of columns with missing values in the dataset": len(data.isna().sum()[data.isna().sum() != 0])}).to_string())
+print(pd.Series({"Number of columns with missing values in the dataset": len(profile.columns_with_missing())}).to_string())
 
 # Columns with missing values and respective proportions of values that are missing
-print((data.isna().sum()/len(data))[data.isna().sum() != 0].sort_values(ascending = False))
+print(profile.missing_proportion()[profile.columns_with_missing()].sort_values(ascending = False))
 
 # Statistical description of numerical variables in the dataset
 data.describe()
 
 # Statistical description of categorical variables in the dataset
-data.describe(include = ['O'])
+data.describe(include = ['category'])
 
 # Dropping constant columns
 data.drop(cols_constant, axis = 1, inplace = True)
+profile = profile.drop(cols_constant)
 cols_int.remove('readmission_status')
 
 """**Dataset synopsis:**
 
 - Number of observations: $91713$
 - Number of columns: $186$
-- Number of integer columns: $8$
-- Number of float columns: $170$
-- Number of object columns: $8$
+- Number of integer columns: $20$ (`int32` identifiers and `Int8` binary flags)
+- Number of float columns: $158$ (`float32`)
+- Number of categorical columns: $8$
 - Number of duplicate observations: $0$
 - Constant column: `readmission_status`
 - Number of columns with missing values: $175$
 - Columns with over $90\%$ missing values: `h1_bilirubin_max`, `h1_bilirubin_min`, `h1_lactate_min`, `h1_lactate_max`, `h1_albumin_max`
-- Memory Usage: $130.15$ MB
+- Memory Usage: about $60$ MB (against $130.15$ MB with the default `int64`, `float64` and `object` data types)
 
 <a name = "Univariate-Analysis"></a>
 ## 2.3. Univariate Analysis
@@ -250,22 +274,15 @@ bar_donut(data, 'hospital_death')
 """
 
 # Function to compute almost constant columns and relative frequencies of corresponding modes
-def almost_constant(df, threshold = 0.9, show = True, return_list = True):
-    rel_freq = []
-    for col in df.columns:
-        mode_rel_freq = max(df[col].value_counts(sort = True)/len(df[col]))
-        if mode_rel_freq > threshold:
-            rel_freq.append((col, mode_rel_freq))
-    keys = [item[0] for item in rel_freq]
-    values = [item[1] for item in rel_freq]
-    series = pd.Series(data = values, index = keys).sort_values(ascending = False)
+def almost_constant(profile, threshold = 0.9, show = True, return_list = True):
+    series = profile.almost_constant(threshold)
     if show == True:
         print(series.to_string())
     if return_list == True:
-        return keys
+        return series.index.tolist()
 
 # Almost constant columns and relative frequencies of corresponding modes
-almost_constant_cols = almost_constant(data.drop('hospital_death', axis = 1), threshold = 0.9)
+almost_constant_cols = almost_constant(profile.drop('hospital_death'), threshold = 0.9)
 
 """**Observations:**
 - The column `readmission_status` is same for every observation, and hence is not relevant in the context of predicting the target variable
@@ -298,7 +315,7 @@ def donuts_grid(df, cols, ncols = 3, hole = 0.5, height = 1500, width = 900):
     fig.show()
 
 # Binary columns except gender and hospital_death
-cols_binary = [col for col in data.columns if data[col].nunique() == 2]
+cols_binary = profile.binary()
 cols_binary.remove('gender')
 cols_binary.remove('hospital_death')
 donuts_grid(data, cols_binary, ncols = 4, hole = 0.5, height = 1250, width = 1200)
@@ -317,7 +334,7 @@ fig.update_layout(height = 450, width = 900, showlegend = False)
 fig.show()
 
 # Columns with 4 to 15 distinct values
-cols_selected = [col for col in data.columns if 3 < data[col].nunique() <= 15]
+cols_selected = profile.select(min_unique = 4, max_unique = 15)
 col_vert = ['ethnicity', 'hospital_admit_source', 'icu_admit_source', 'icu_type', 'apache_3j_bodysystem', 'apache_2_bodysystem']
 nrows = math.ceil(len(cols_selected)/3)
 fig, ax = plt.subplots(nrows, 3, figsize = (15, 6.2*nrows), sharey = False)
@@ -331,57 +348,59 @@ plt.tight_layout()
 plt.show()
 
 # Non-float columns with more than 15 distinct values
-[col for col in data.columns if data[col].nunique() > 15 and data[col].dtype != 'float64']
+profile.select(min_unique = 16, exclude_kind = 'float')
 
 # Number of unique values
 keys = ['encounter_id', 'patient_id', 'hospital_id', 'icu_id']
-values = [data[col].nunique() for col in keys]
+values = profile.nunique[keys].tolist()
 print(pd.Series(data = values, index = keys).to_string())
 
 """**Observation:** The features `encounter_id` and `patient_id` are unique for each observation, and hence do not contribute to the task of predicting the target variable."""
 
 # Dropping encounter_id and patient_id
 data.drop(['encounter_id', 'patient_id'], axis = 1, inplace = True)
+profile = profile.drop(['encounter_id', 'patient_id'])
 cols_int.remove('encounter_id')
 cols_int.remove('patient_id')
 
 # hospital_id
-plt.figure(figsize = (15, data['hospital_id'].nunique()/6))
+plt.figure(figsize = (15, profile.nunique['hospital_id']/6))
 sns.countplot(data = data, y = 'hospital_id')
 plt.tight_layout()
 plt.show()
 
 # icu_id
-plt.figure(figsize = (15, data['icu_id'].nunique()/6))
+plt.figure(figsize = (15, profile.nunique['icu_id']/6))
 sns.countplot(data = data, y = 'icu_id')
 plt.tight_layout()
 plt.show()
 
 # Histograms in grid
-def distribution_plot(df, cols, ncols = 4, kind = 'hist', hue = None, height = 0.84*4, width = 4):
-    cols = [col for col in df.columns if df[col].nunique() > 15 and df[col].dtype == 'float64']
-    bins_fd = math.floor(len(df)**(1/3))
-    nrows = math.ceil(len(cols)/ncols)
-    if kind == 'hist':
-        fig, ax = plt.subplots(nrows, ncols, figsize = (width*ncols, height*nrows), sharey = False)
-        for i in range(len(cols)):
-            sns.histplot(data = df, x = cols[i], bins = bins_fd, hue = hue, ax = ax[i // ncols, i % ncols])
-            if i % ncols != 0:
-                ax[i // ncols, i % ncols].set_ylabel(" ")
-    elif kind == 'kde':
-        fig, ax = plt.subplots(nrows, ncols, figsize = (width*ncols, height*nrows), sharey = False)
-        for i in range(len(cols)):
-            sns.kdeplot(data = df, x = cols[i], hue = hue, ax = ax[i // ncols, i % ncols])
-            if i % ncols != 0:
-                ax[i // ncols, i % ncols].set_ylabel(" ")
-    else:
+def distribution_plot(df, cols, ncols = 4, kind = 'hist', hue = None, height = 0.84*4, width = 4, summary = None):
+    if kind not in ['hist', 'kde']:
         raise TypeError(f"'{kind}' is not a valid argument for the parameter kind. Use 'hist' or 'kde'.")
+    # Histograms and KDEs of all columns are computed in one pass (bins_fd bins), then only drawn
+    if summary is None:
+        summary = DensitySummary.from_frame(df, cols, hue = hue, bins = math.floor(len(df)**(1/3)))
+    # The histograms of a summary split by a hue are summed over its levels when no hue is asked for
+    pooled = hue is None and summary.hue is not None
+    colors = sns.color_palette(n_colors = 1 if pooled else len(summary.hue_levels))
+    nrows = math.ceil(len(cols)/ncols)
+    fig, ax = plt.subplots(nrows, ncols, figsize = (width*ncols, height*nrows), sharey = False, squeeze = False)
+    for i in range(len(cols)):
+        if kind == 'hist':
+            summary.draw_histogram(ax[i // ncols, i % ncols], cols[i], colors = colors, pooled = pooled)
+        else:
+            summary.draw_kde(ax[i // ncols, i % ncols], cols[i], colors = colors)
+        if i % ncols != 0:
+            ax[i // ncols, i % ncols].set_ylabel(" ")
     plt.tight_layout()
     plt.show()
 
-# Float columns with more than 15 distinct values
-cols_selected = [col for col in data.columns if data[col].nunique() > 15 and data[col].dtype == 'float64']
-distribution_plot(df = data, cols = cols_selected, kind = 'hist')
+# Float columns with more than 15 distinct values, summarized once by hospital_death for these histograms and the KDEs of section 2.4
+cols_float_selected = profile.select(min_unique = 16, kind = 'float')
+float_summary = DensitySummary.from_frame(data, cols_float_selected, hue = 'hospital_death', bins = bins_fd)
+distribution_plot(df = data, cols = cols_float_selected, kind = 'hist', summary = float_summary)
 
 """<a name = "Multivariate-Analysis"></a>
 ## 2.4. Multivariate Analysis
@@ -395,29 +414,21 @@ distribution_plot(df = data, cols = cols_selected, kind = 'hist')
 ### Correlation structure among numerical features
 """
 
-# Heatmap
+# Correlation matrix, computed once
 cols_selected = [col for col in cols_int + cols_float if col != 'hospital_death']
-plt.figure(figsize = (180, 135))
-sns.heatmap(data[cols_selected].corr(), annot = True, cmap = plt.cm.CMRmap_r)
+corr_matrix = correlation_matrix(data, cols_selected)
+
+# Heatmap: clustered overview, and tiles of 40 features in clustered order with the cells above 0.9 annotated
+correlation_report(corr_matrix, threshold = 0.9, tile_size = 40)
+plt.show()
 
 # Function to detect pairs with extreme correlation
 def pairs_with_strong_corr(df, cols, threshold = 0.8, show = True, return_variables = False):
-    variable_list = []
-    corr_positive_list = []
-    corr_negative_list = []
-    for i in range(len(cols)):
-        for j in range(len(cols)):
-            if i<j:
-                corr = df[cols[i]].corr(df[cols[j]])
-                if corr > threshold:
-                    variable_list = variable_list + [cols[i], cols[j]]
-                    corr_positive_list.append(((cols[i], cols[j]), corr))
-                if corr < -threshold:
-                    variable_list = variable_list + [cols[i], cols[j]]
-                    corr_negative_list.append(((cols[i], cols[j]), corr))
+    pairs = strong_pairs(df, cols, threshold = threshold)
+    variable_list = [col for pair in pairs.index for col in pair]
     if show == True:
-        corr_positive = pd.Series(data = [item[1] for item in corr_positive_list], index = [item[0] for item in corr_positive_list])
-        corr_negative = pd.Series(data = [item[1] for item in corr_negative_list], index = [item[0] for item in corr_negative_list])
+        corr_positive = pairs[pairs > threshold]
+        corr_negative = pairs[pairs < -threshold]
         print("Pairs with extreme positive correlation:")
         print(" ")
         print(corr_positive.sort_values(ascending = False).to_string())
@@ -443,8 +454,8 @@ pairs_with_strong_corr(df = data, cols = cols_selected, threshold = 0.9)
 """
 
 # Contingency tables for target variable and binary features
-def contingency_binary(df, target, ncols = 3, figsize_multiplier = 2):
-    cols_binary = [col for col in df.columns if df[col].nunique() == 2]
+def contingency_binary(df, target, profile, ncols = 3, figsize_multiplier = 2):
+    cols_binary = profile.binary()
     cols_binary.remove(target)
     if len(cols_binary) == 0:
         print("The dataset does not contain a binary feature")
@@ -453,14 +464,11 @@ def contingency_binary(df, target, ncols = 3, figsize_multiplier = 2):
         nvals = 2 # Binary variables
         figsize = (figsize_multiplier*nvals*ncols, 0.8*figsize_multiplier*nvals*nrows)
         fig, ax = plt.subplots(nrows, ncols, figsize = figsize, sharey = False)
-        class_names_2 = df[target].value_counts().index.tolist()
+        tables = contingency_tables(df, target, cols_binary)
         for i in range(len(cols_binary)):
-            class_names_1 = df[cols_binary[i]].value_counts().index.tolist()
-            contingency_mat = np.zeros(shape = (len(class_names_2), len(class_names_1)))
-            for j in range(len(class_names_2)):
-                for k in range(len(class_names_1)):
-                    contingency_mat[j][k] = len([l for l in range(len(df)) if df[target][l] == class_names_2[j] and df[cols_binary[i]][l] == class_names_1[k]])
-            contingency_table_df = pd.DataFrame(contingency_mat)
+            class_names_1 = tables[cols_binary[i]].feature_classes.tolist()
+            class_names_2 = tables[cols_binary[i]].target_classes.tolist()
+            contingency_table_df = pd.DataFrame(tables[cols_binary[i]].counts)
             hm = sns.heatmap(contingency_table_df, annot = True, annot_kws = {"size": 16}, fmt = 'g', ax = ax[i // ncols, i % ncols])
             hm.set_xlabel(f'{cols_binary[i]}', fontsize = 14)
             hm.set_ylabel(target, fontsize = 14)
@@ -472,19 +480,15 @@ def contingency_binary(df, target, ncols = 3, figsize_multiplier = 2):
         plt.show()
 
 # Target x Binary features
-contingency_binary(df = data, target = 'hospital_death', ncols = 3, figsize_multiplier = 2)
+contingency_binary(df = data, target = 'hospital_death', profile = profile, ncols = 3, figsize_multiplier = 2)
 
 # Contingency table for target variable and general categorical feature
 def contingency_table(df, feature, target, figsize_multiplier = 2, title = False, rotate_xticklabels = 0, rotate_yticklabels = 0):
-    class_names_1 = df[feature].value_counts().index.tolist()
-    class_names_2 = df[target].value_counts().index.tolist()
-
-    contingency_mat = np.zeros(shape = (len(class_names_2), len(class_names_1)))
-    for i in range(len(class_names_2)):
-        for j in range(len(class_names_1)):
-            contingency_mat[i][j] = len([k for k in range(len(df)) if df[target][k] == class_names_2[i] and df[feature][k] == class_names_1[j]])
+    table = contingency_tables(df, target, [feature])[feature]
+    class_names_1 = table.feature_classes.tolist()
+    class_names_2 = table.target_classes.tolist()
 
-    contingency_table_df = pd.DataFrame(contingency_mat)
+    contingency_table_df = pd.DataFrame(table.counts)
     plt.figure(figsize = (figsize_multiplier*len(class_names_1), 0.8*figsize_multiplier*len(class_names_2)))
     if title == True:
         plt.title(f"{target} x {feature}")
@@ -497,7 +501,7 @@ def contingency_table(df, feature, target, figsize_multiplier = 2, title = False
     plt.show()
 
 # Target x Features taking 3 to 15 distinct values
-cols_selected = [col for col in data.columns if 3 <= data[col].nunique() <= 15]
+cols_selected = profile.select(min_unique = 3, max_unique = 15)
 cols_xticklabels = ['ethnicity', 'hospital_admit_source', 'icu_admit_source', 'icu_type', 'apache_3j_bodysystem', 'apache_2_bodysystem']
 for col in cols_selected:
     if col in cols_xticklabels:
@@ -507,8 +511,7 @@ for col in cols_selected:
     contingency_table(df = data, feature = col, target = 'hospital_death', figsize_multiplier = 1.6, rotate_xticklabels = rotate_xticklabels)
 
 # Target x Float features with more than 15 distinct values
-cols_selected = [col for col in data.columns if data[col].nunique() > 15 and data[col].dtype == 'float64']
-distribution_plot(df = data, cols = cols_selected, kind = 'kde', hue = 'hospital_death')
+distribution_plot(df = data, cols = cols_float_selected, kind = 'kde', hue = 'hospital_death', summary = float_summary)
 
 """<a name = "Data-Preprocessing"></a>
 # 3. Data Preprocessing
@@ -517,14 +520,17 @@ distribution_plot(df = data, cols = cols_selected, kind = 'kde', hue = 'hospital
 - Missing Data Imputation
 - Categorical Data Encoding
 - Normalization
+- Preprocessing Pipeline
 
 <a name = "Train-Test-Split"></a>
 ## 3.1. Train-Test Split
 """
 
+recorder.begin('split', rows = len(data))
 X = data.drop('hospital_death', axis = 1) # Independent variables
 y = data['hospital_death'] # Target variable
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size = 0.2, shuffle = True)
+recorder.end()
 
 """### Training data"""
 
@@ -546,23 +552,31 @@ bar_donut(pd.DataFrame(y_test), 'hospital_death', manual_title_text = True,
 
 """<a name = "Missing-Data-Imputation"></a>
 ## 3.2. Missing Data Imputation
+
+The imputation, the encoding and the normalization are learnt from the training set only, by the preprocessing pipeline of section 3.5, which is fitted here. The cells of this section and of the next two show what each of its pieces does, on a few rows of the training set.
 """
 
+# Fitting the preprocessing pipeline on the training set: dropped columns, imputation distributions, category vocabularies and scaling constants
+recorder.begin('preprocess', rows = len(X))
+preprocessor = PreprocessingPipeline(cols_object = cols_object).fit(X_train)
+preprocessor.save('preprocessor.pkl')
+recorder.end()
+X_sample = X_train.head()
+
 # Count of missing values for the target variable
 print(pd.Series({"Number of missing target values in the training set": y_train.isna().sum(),
                  "Number of missing target values in the test set": y_test.isna().sum()}).to_string())
 
 """### Dropping columns with majority of the observations missing"""
 
-# Columns with more than 50% missing values in the training set
-print((X_train.isna().sum()/len(X_train))[X_train.isna().sum()/len(X_train) > 0.5].sort_values(ascending = False))
+# Columns with more than 50% missing values in the training set, dropped by the pipeline
+train_missing = DatasetProfile.from_frame(X_train).missing_proportion()
+print(train_missing[preprocessor.dropped_].sort_values(ascending = False))
 
 """We drop the $74$ features, which have over $50\%$ values missing in the training dataset, from the subsequent analysis."""
 
 # Dropping columns with more than 50% missing values in the training set
-majority_missing = (X_train.isna().sum()/len(X_train))[data.isna().sum()/len(data) > 0.5].index.tolist()
-X_train.drop(majority_missing, axis = 1, inplace = True)
-X_test.drop(majority_missing, axis = 1, inplace = True)
+X_sample = X_sample.drop(preprocessor.dropped_, axis = 1)
 
 """### Mode imputation"""
 
@@ -575,120 +589,116 @@ def mode_imputer(data):
 
 """### Proportion-based imputation
 
-With the goal of keeping the feature distributions same before and after imputation, we impute the missing values in a column in such a way so that the proportions of the existing unique values in that particular column remain roughly same as those were prior to the imputation. The following function takes a dataframe, implements the proportion-based imputation in each column containing missing values and returns the resulting dataframe.
+With the goal of keeping the feature distributions same before and after imputation, we impute the missing values in a column in such a way so that the proportions of the existing unique values in that particular column remain roughly same as those were prior to the imputation. The `ProportionImputer` learns the observed values of each column and their proportions from the training set, and then draws exactly one value per missing cell, so the test set is imputed with the training distributions.
 """
 
 # Function to impute missing values proportionately with respect to the existing unique values
-def prop_imputer(df):
-    df_prop = df.copy(deep = True)
-    missing_cols = df_prop.isna().sum()[df_prop.isna().sum() != 0].index.tolist()
-    for col in missing_cols:
-        values_col = df_prop[col].value_counts(normalize = True).index.tolist()
-        probabilities_col = df_prop[col].value_counts(normalize = True).values.tolist()
-        df_prop[col] = df_prop[col].fillna(pd.Series(data = np.random.choice(values_col, p = probabilities_col, size = len(df_prop)), index = df_prop[col].index))
-    return df_prop
-
-# Proportion-based imputation
-X_train = prop_imputer(X_train)
-X_test = prop_imputer(X_test)
+def prop_imputer(df, imputer = None, random_state = None):
+    if imputer is None:
+        imputer = ProportionImputer(random_state = random_state).fit(df)
+    return imputer.transform(df)
+
+# Proportion-based imputation, with the distributions learnt by the pipeline from the training set
+X_sample = prop_imputer(X_sample, preprocessor.imputer_)
+X_sample
 
 """<a name = "Categorical-Data-Encoding"></a>
 ## 3.3. Categorical Data Encoding
 """
 
 # Object type columns and corresponding number of unique values
-print(pd.Series(data = [data[col].nunique() for col in cols_object], index = cols_object).to_string())
+print(profile.nunique[cols_object].to_string())
 
 """All $8$ categorical features are nominal in nature, i.e. there is no notion of order in their realized values.
 
 ### Label encoding
 """
 
-def label_encoder(df, cols):
+def label_encoder(df, encoder):
     df_le = df.copy(deep = True)
-    le = LabelEncoder()
-    for col in cols:
-        df_le[col] = le.fit_transform(df_le[col])
+    df_le[encoder.columns_] = encoder.label_codes(df)
     return df_le
 
 """Explanation of the arguments:
 - **df:** The input dataset
-- **cols:** List of columns that we want to encode
+- **encoder:** A `CategoricalEncoder` fitted on the training set, which holds the vocabularies of the columns that we want to encode
 """
 
-X_train_le = label_encoder(X_train, cols_object)
-X_test_le = label_encoder(X_test, cols_object)
+# Vocabularies learnt by the pipeline from the training set only, so that train and test share the same codes
+X_sample_le = label_encoder(X_sample, preprocessor.encoder_)
 
-"""For a categorical column with $n$ distinct values, the label encoder maps the $n$ distinct values to numerical values between $0$ and $n-1$."""
+"""For a categorical column with $n$ distinct values in the training set, the label encoder maps the $n$ distinct values to numerical values between $0$ and $n-1$; a value not seen in training is mapped to $n.$"""
 
 # Example
-X_train_le[[col for col in X_train_le.columns if cols_object[1] in col]]
+X_sample_le[[col for col in X_sample_le.columns if cols_object[1] in col]]
 
 """### One-hot encoding"""
 
 # Function for one-hot encoding
-def one_hot_encoder(df, cols, drop_first = False):
-    cols = [col for col in cols if col in df.columns] # To ensure that 'cols' is contained (as a subset) within df.columns
-    df_ohe = pd.get_dummies(df, columns = cols, drop_first = drop_first)
+def one_hot_encoder(df, encoder):
+    cols = [col for col in df.columns if col not in encoder.columns_]
+    df_ohe = pd.concat([df[cols], encoder.transform(df, dtype = np.uint8, as_frame = True)], axis = 1)
     return df_ohe
 
 """Explanation of the arguments:
 - **df:** The input dataset
-- **cols:** List of columns that we want to encode
+- **encoder:** A `CategoricalEncoder` fitted on the training set, which holds the vocabularies of the columns that we want to encode
+
+The training and test sets are encoded separately against the training vocabularies, so they need not be concatenated.
 """
 
-# One-hot encoding with drop_first = False
-X_concat = pd.concat([X_train, X_test])
-X_concat_ohe = one_hot_encoder(X_concat, cols_object, drop_first = False)
-X_train_ohe = X_concat_ohe.loc[X_train.index]
-X_test_ohe = X_concat_ohe.loc[X_test.index]
+# One-hot encoding with drop_first = False, against the vocabularies of the pipeline
+encoder = CategoricalEncoder(drop_first = False).set_vocabularies(preprocessor.vocabularies_)
+X_sample_ohe = one_hot_encoder(X_sample, encoder)
 
-"""For a categorical column with $k$ distinct values, the [one-hot](https://en.wikipedia.org/wiki/One-hot) encoder produces $k$ new columns, one corresponding to each unique value. The original column is then dropped."""
+"""For a categorical column with $k$ distinct values in the training set, the [one-hot](https://en.wikipedia.org/wiki/One-hot) encoder produces $k$ new columns, one corresponding to each unique value, and a column `__unknown__` for values not seen in training. The original column is then dropped."""
 
 # Example
-X_train_ohe[[col for col in X_train_ohe.columns if cols_object[1] in col]]
+X_sample_ohe[[col for col in X_sample_ohe.columns if cols_object[1] in col]]
 
-"""Note that `gender_F` and `gender_M` are related by `gender_F + gender_M = 1`. Hence we shall lose no information by dropping one of these columns. This can be done (for each feature) by changing `drop_first = False` to `drop_first = True`."""
+"""Note that `gender_F` and `gender_M` are related by `gender_F + gender_M + gender___unknown__ = 1`. Hence we shall lose no information by dropping one of these columns. This can be done (for each feature) by changing `drop_first = False` to `drop_first = True`, as in the encoder of the pipeline."""
 
-# One-hot encoding with drop_first = True
-X_concat_ohe = one_hot_encoder(X_concat, cols_object, drop_first = True)
-X_train_ohe = X_concat_ohe.loc[X_train.index]
-X_test_ohe = X_concat_ohe.loc[X_test.index]
+# One-hot encoding with drop_first = True: the encoder of the pipeline
+X_sample_ohe = one_hot_encoder(X_sample, preprocessor.encoder_)
 
 """Now the one-hot encoder produces $k-1$ new columns for a categorical column with $k$ distinct values, by dropping the first column. As before, the original column is also dropped."""
 
 # Example
-X_train_ohe[[col for col in X_train_ohe.columns if cols_object[1] in col]]
+X_sample_ohe[[col for col in X_sample_ohe.columns if cols_object[1] in col]]
 
-"""To have a column corresponding to `nan` values (if they are present in the original column), one must set the `dummy_na` parameter of the `get_dummies` function to be `True` (which is by default `False`)."""
-
-# Replacing original predictors with encoded predictors
-X_train = X_train_ohe
-X_test = X_test_ohe
+"""A missing value (if present in the original column) is encoded as a row of zeros. The encoder can also write the dummies straight into a slice of a preallocated feature matrix (`encoder.transform(df, out = X, offset = j)`), or return them as a sparse matrix (`encoder.transform_sparse(df)`). The preprocessing pipeline writes the dummies into its feature matrix in this way."""
 
 """<a name = "Normalization"></a>
 ## 3.4. Normalization
 """
 
-# Min-max normalization of predictors in the training set
-for col in X_train.columns:
-    if X_train[col].dtypes == 'int64' or X_train[col].dtypes == 'float64': # Checking if the column is numerical
-        if X_train[col].nunique() > 1: # Checking if the column is non-constant
-           X_train[col] = (X_train[col] - X_train[col].min()) / (X_train[col].max() - X_train[col].min())
-X_train
+"""Each non-constant column is mapped to $[0, 1]$ by $(x - m)/(M - m)$, where the minimum $m$ and the maximum $M$ are computed on the training set and reused for the test set. Constant columns are left unchanged, and one-hot encoded columns already take values in $0$ and $1$."""
 
-# Min-max normalization of predictors in the test set
-for col in X_test.columns:
-    if X_test[col].dtypes == 'int64' or X_test[col].dtypes == 'float64': # Checking if the column is numerical
-        if X_test[col].nunique() > 1: # Checking if the column is non-constant
-           X_test[col] = (X_test[col] - X_test[col].min()) / (X_test[col].max() - X_test[col].min())
-X_test
+# Min-max normalization constants learnt by the pipeline from the training set
+pd.DataFrame({'Minimum': preprocessor.scaler_.min_, 'Maximum': preprocessor.scaler_.max_}, index = preprocessor.numerical_)
+
+# Min-max normalization of the numerical predictors of the example rows
+preprocessor.scaler_.transform(X_sample[preprocessor.numerical_])
+
+"""<a name = "Preprocessing-Pipeline"></a>
+## 3.5. Preprocessing Pipeline
+
+The steps above are bundled in a single transformer, which learns the dropped columns, the imputation distributions, the category vocabularies and the scaling constants from the training set only. It is saved to disk and applies them to the test set, or to any new batch of patients, with a single call. In particular, the test set is scaled with the training constants rather than with its own minimum and maximum.
+"""
+
+# Transforming the training and test sets with the pipeline fitted in section 3.2
+recorder.begin('transform', rows = len(X))
+X_train = preprocessor.transform(X_train, as_frame = True)
+X_test = preprocessor.transform(X_test, as_frame = True)
+recorder.end()
+X_train
 
 """<a name = "Baseline-Neural-Network"></a>
 # 4. Baseline Neural Network
 """
 
 # Adding layers to sequential model
+recorder.begin('train', rows = len(X_train))
 model = Sequential()
 model.add(Dense(16, input_dim = len(X_train.columns), activation = 'relu'))
 model.add(Dense(12, activation = 'relu'))
@@ -700,8 +710,12 @@ model.summary()
 # Specifying loss function and optimizer
 model.compile(loss = 'binary_crossentropy', optimizer = 'adam', metrics = ['accuracy'])
 
+# Input pipelines: the float32 feature matrices are converted to tensors once, then batched, shuffled and prefetched
+train_ds, test_ds = fit_datasets(X_train, y_train, validation_data = (X_test, y_test), batch_size = 64)
+
 # Training the model
-history = model.fit(X_train, y_train, validation_data = (X_test, y_test), epochs = 100, batch_size = 64)
+history = model.fit(train_ds, validation_data = test_ds, epochs = 100)
+recorder.end()
 
 # Visualization of model accuracy
 model_accuracy = pd.DataFrame()
@@ -732,16 +746,15 @@ plt.legend()
 plt.show()
 
 # Prediction on test set
-pred = model.predict(X_test)
+pred = model.predict(test_ds)[:, 0]
 threshold = 0.5
-y_pred = [0 if pred[i][0] < threshold else 1 for i in range(len(pred))]
 
-# Function to compute and visualize confusion matrix
-def confusion_mat(y_pred, y_test):
+# Confusion counts at every threshold, from a single sort of the predicted probabilities
+curve = threshold_curve(y_test, pred)
+
+# Function to visualize a confusion matrix
+def confusion_mat(confusion_matrix):
     class_names = [0, 1]
-    tick_marks_y = [0.5, 1.5]
-    tick_marks_x = [0.5, 1.5]
-    confusion_matrix = metrics.confusion_matrix(y_test, y_pred)
     confusion_matrix_df = pd.DataFrame(confusion_matrix, range(2), range(2))
     plt.figure(figsize = (6, 4.75))
     plt.title("Confusion Matrix", fontsize = 14)
@@ -754,44 +767,20 @@ def confusion_mat(y_pred, y_test):
     plt.show()
 
 # Confusion matrix
-confusion_mat(y_pred, y_test)
-
-# Evaluation metrics
-acc = accuracy_score(y_test, y_pred)
-roc_auc = roc_auc_score(y_test, y_pred)
-precision = precision_score(y_test, y_pred)
-recall = recall_score(y_test, y_pred)
-f1 = f1_score(y_test, y_pred)
+confusion_mat(curve.confusion_matrix(threshold))
 
-print(pd.Series({"Accuracy": acc,
-                 "ROC-AUC": roc_auc,
-                 "Precision": precision,
-                 "Recall": recall,
-                 "F1-score": f1}).to_string())
+# Evaluation metrics (ROC-AUC and PR-AUC are computed from the probabilities, over all thresholds)
+print(evaluation_report(y_test, pred, threshold, curve = curve).to_string())
 
 """<a name = "Hyperparameter-Tuning"></a>
 # 5. Hyperparameter Tuning
 """
 
-# Building the model
-def model_builder(ht):
-    model = Sequential()
-    model.add(keras.layers.Flatten(input_shape = (X_train.shape[1],)))
-
-    # Tuning the number of units in the first Dense layer
-    ht_units = ht.Int('units', min_value = 32, max_value = 512, step = 32) # 32-512
-    model.add(keras.layers.Dense(units = ht_units, activation = 'relu'))
-    model.add(keras.layers.Dense(12, activation = 'relu'))
-    model.add(keras.layers.Dense(8, activation = 'relu'))
-    model.add(keras.layers.Dense(4, activation = 'relu'))
-    model.add(keras.layers.Dense(1, activation = 'sigmoid'))
-
-    # Tuning the learning rate for the optimizer
-    ht_learning_rate = ht.Choice('learning_rate', values = [0.01, 0.001, 0.0001])
+"""The hypermodel is a Dense network whose first layer has a tuned number of units (32 to 512), followed by layers of 12, 8 and 4 units and a sigmoid output; the learning rate is tuned among $0.01$, $0.001$ and $0.0001$. It is defined in `src/models.py`, so that the same architecture is used by the parallel search, which spreads the Hyperband trials over the local cores (`python -m src.tuning content/Dataset.csv --workers 4 --compare-serial`)."""
 
-    model.compile(loss = 'binary_crossentropy', optimizer = 'adam', metrics = ['accuracy'])
-
-    return model
+# Building the model
+recorder.begin('tune', rows = len(X_train))
+model_builder = make_model_builder(X_train.shape[1])
 
 # Making the tuner
 tuner = kt.Hyperband(model_builder,
@@ -803,8 +792,11 @@ tuner = kt.Hyperband(model_builder,
 # Early stopping
 stop_early = tf.keras.callbacks.EarlyStopping(monitor = 'val_loss', patience = 5)
 
+# Training and validation pipelines (the last 20% of the training set, as validation_split = 0.2), shared by all trials and the retraining
+train_split_ds, val_split_ds = fit_datasets(X_train, y_train, validation_split = 0.2)
+
 # Implementing the tuner
-tuner.search(X_train, y_train, epochs = 50, validation_split = 0.2, callbacks = [stop_early])
+tuner.search(train_split_ds, validation_data = val_split_ds, epochs = 50, callbacks = [stop_early])
 
 # Get the optimal hyperparameters
 best_hparams = tuner.get_best_hyperparameters(num_trials = 1)[0]
@@ -814,82 +806,119 @@ print(" ")
 print(pd.Series({"Optimal number of units in the first densely-connected layer": best_hparams.get('units'),
                  "Optimal learning rate for the optimizer": best_hparams.get('learning_rate')}).to_string())
 
+"""The model with the optimal hyperparameters is trained once, for up to $50$ epochs. The weights of the epoch with the maximum validation accuracy are kept in memory and restored at the end, so there is no need to retrain a fresh model for the best number of epochs. Training stops early once the validation accuracy has not improved for $10$ epochs."""
+
 # Building the model with optimal hyperparameters
 model = tuner.hypermodel.build(best_hparams)
 
-# Training the model
-history = model.fit(X_train, y_train, epochs = 50, validation_split = 0.2)
-
-# Validation accuracy
-val_accuracy_optimal = history.history['val_accuracy']
-
-# Computing best epoch in terms of maximum validation accuracy
-best_epoch = val_accuracy_optimal.index(max(val_accuracy_optimal)) + 1
+# Training the model, keeping the weights of the best epoch in terms of maximum validation accuracy
+model_tuned, history, best_epoch = train_best_epoch(model, train_split_ds, val_split_ds, epochs = 50,
+                                                    monitor = 'val_accuracy', mode = 'max', patience = 10)
+recorder.end()
 print(" ")
 print(pd.Series({"Best epoch": (best_epoch)}).to_string())
 
-# Re-instantiating the model
-model_tuned = tuner.hypermodel.build(best_hparams)
-
-# Re-training the hypermodel with the optimal number of epochs
-model_tuned.fit(X_train, y_train, epochs = best_epoch, validation_split = 0.2)
-
 # Evaluation on the test set
-eval_tuned = model_tuned.evaluate(X_test, y_test)
+recorder.begin('evaluate', rows = len(X_test))
+eval_tuned = model_tuned.evaluate(test_ds)
 print(" ")
 print(pd.Series({"Test loss": eval_tuned[0],
                  "Test accuracy": eval_tuned[1]}).to_string())
 
 # Confusion matrix
-pred_tuned = model_tuned.predict(X_test)
+pred_tuned = model_tuned.predict(test_ds)[:, 0]
 threshold = 0.5
-y_pred_tuned = [0 if pred_tuned[i][0] < threshold else 1 for i in range(len(pred_tuned))]
-confusion_mat(y_pred_tuned, y_test)
-
-# Evaluation metrics
-acc = accuracy_score(y_test, y_pred_tuned)
-roc_auc = roc_auc_score(y_test, y_pred_tuned)
-precision = precision_score(y_test, y_pred_tuned)
-recall = recall_score(y_test, y_pred_tuned)
-f1 = f1_score(y_test, y_pred_tuned)
-
-print(pd.Series({"Accuracy": acc,
-                 "ROC-AUC": roc_auc,
-                 "Precision": precision,
-                 "Recall": recall,
-                 "F1-score": f1}).to_string())
+y_pred_tuned = (pred_tuned >= threshold).astype(int)
+curve_tuned = threshold_curve(y_test, pred_tuned)
+confusion_mat(curve_tuned.confusion_matrix(threshold))
+
+# Evaluation metrics, with 95% bootstrap confidence intervals
+print(bootstrap(y_test, pred_tuned, n_resamples = 1000, threshold = threshold, seed = 0).to_string())
+recorder.end()
+
+# ROC curve, precision-recall curve and metrics against the threshold, with the threshold maximizing the F1-score
+optimal_threshold = curve_tuned.optimal_threshold('f1')
+plot_curves(curve_tuned, threshold = optimal_threshold)
+plt.show()
+print(" ")
+print(pd.Series({"Threshold maximizing the F1-score": optimal_threshold}).to_string())
+print(" ")
+print(curve_tuned.metrics_at(optimal_threshold).to_string())
+
+"""### Cross-validation
+
+A single train-test split gives one noisy estimate of the performance. The tuned architecture is therefore also evaluated by $5$-fold cross-validation on the whole dataset, with a fixed seed. The folds are trained concurrently, one process per fold, each limited to its own share of the cores. Every fold fits its own preprocessing pipeline on its training part, so nothing leaks from the held-out part. The same can be run from the command line with `python -m src.cross_validation content/Dataset.csv --compare-serial`, which also times the folds run one after the other.
+"""
+
+# 5-fold cross-validation of the tuned architecture
+recorder.begin('cross_validate', rows = len(data))
+cv_folds, cv_time = cross_validate('content/Dataset.csv', n_splits = 5, units = best_hparams.get('units'),
+                                   learning_rate = best_hparams.get('learning_rate'), epochs = 50, patience = 10, seed = 0)
+recorder.end()
+print(cv_folds.to_string())
+print(" ")
+print(summarize_folds(cv_folds).to_string())
+print(" ")
+print(pd.Series({"Cross-validation runtime": "{:.2f} seconds".format(cv_time)}).to_string())
 
 """### Saving and loading the model"""
 
 # Saving the model
+recorder.begin('export')
 model_tuned.save('model_tuned.h5')
 
 # Loading the model
 model_tuned_loaded = load_model('model_tuned.h5')
 
+# Exporting the weights for scoring without TensorFlow, after checking the NumPy forward pass against Keras
+model_tuned_numpy = NumpyMLP.from_keras(model_tuned_loaded)
+export_difference = max_abs_difference(model_tuned_loaded, model_tuned_numpy)
+print(pd.Series({"Maximum absolute difference between NumPy and Keras predictions": export_difference}).to_string())
+assert export_difference <= EXPORT_ATOL, "NumPy and Keras predictions differ by more than the export tolerance"
+model_tuned_numpy.save('model_tuned.npz')
+recorder.end()
+
+"""The saved model (or its exported weights) and the saved preprocessing pipeline are all that is needed to score new encounters in bulk, e.g. from the command line:
+
+```
+python -m src.scoring encounters.csv scores.csv --model model_tuned.npz --preprocessor preprocessor.pkl --batch-size 65536
+```
+"""
+
 """<a name = "Explainable-AI"></a>
 # 6. Explainable AI
 """
 
+"""The SHAP values are computed with the DeepLIFT rescale rule (as in SHAP's DeepExplainer) on the NumPy forward pass of the tuned network (`src/explain.py`), against a background of $100$ training rows. The attributions of a patient sum exactly to the predicted probability minus the mean prediction over the background, and take about a millisecond per patient, so a large sample of the test set can be explained. The model-agnostic Kernel SHAP estimate is kept as a check on a few patients; all its perturbed inputs are scored in a few large calls of the NumPy forward pass. Explanations are stored in `explanations.sqlite` (`src/explain_cache.py`), keyed by a hash of the model and background and a hash of the feature row, so a patient already explained, in this run or an earlier one, is served from the store; the least recently used explanations are evicted once the store is full."""
+
 # Loading JavaScript library
 shap.initjs()
 
-# Sampling from test data predictors
-X_test_sample = X_test.sample(50)
+# Sampling from test data predictors, and a background sample from training data predictors
+X_test_sample = X_test.sample(1000, random_state = 0)
+recorder.begin('explain', rows = len(X_test_sample))
+X_background = X_train.sample(100, random_state = 0)
 
 # Predicted values corresponding to the sample
 pred_tuned_sample = np.array(pd.Series(data = pred_tuned.flatten(), index = X_test.index)[X_test_sample.index])
 y_pred_tuned_sample = np.array(pd.Series(data = y_pred_tuned, index = X_test.index)[X_test_sample.index])
 
-# Wrapper function
-def wrap(X):
-    return model_tuned.predict(X).flatten()
-
-# Explainer
-explainer = shap.KernelExplainer(wrap, X_test_sample)
+# Explainer, with its explanations stored on disk (keyed by the model, the background and the feature row)
+explanation_store = ExplanationStore('explanations.sqlite')
+explainer = CachedExplainer(DeepLiftExplainer(model_tuned_numpy, X_background), explanation_store)
 
 # Computing SHAP values based on the sample
-shap_values = explainer.shap_values(X_test_sample, nsamples = 500)
+explain_start = time.perf_counter()
+shap_values = explainer.shap_values(X_test_sample)
+print(pd.Series({"Time per explained patient": "{:.2f} milliseconds".format(1000*(time.perf_counter() - explain_start)/len(X_test_sample)),
+                 "Maximum deviation from prediction minus expected value": np.abs(shap_values.sum(axis = 1) - (pred_tuned_sample - explainer.expected_value)).max()}).to_string())
+
+# Check against Kernel SHAP on a few patients, with a smaller background
+kernel_explainer = KernelExplainer(model_tuned_numpy.predict, X_background.iloc[:20])
+shap_values_kernel = kernel_explainer.shap_values(X_test_sample.iloc[:5], seed = 0)
+shap_values_deeplift = DeepLiftExplainer(model_tuned_numpy, X_background.iloc[:20]).shap_values(X_test_sample.iloc[:5])
+print(pd.Series({"Correlation between DeepLIFT and Kernel SHAP values": np.corrcoef(shap_values_deeplift.ravel(), shap_values_kernel.ravel())[0, 1]}).to_string())
+recorder.end()
 
 """## Global interpretation"""
 
@@ -905,7 +934,7 @@ shap.summary_plot(shap_values = shap_values, features = X_test_sample, plot_type
 shap.initjs()
 row = math.floor(3*len(X_test_sample)/4)
 print(pd.Series({"Predicted value": pred_tuned_sample[row]}).to_string())
-shap_values_row = explainer.shap_values(X_test_sample.iloc[row, :], nsamples = 500)
+shap_values_row = shap_values[row] # Already computed with the sample
 shap.force_plot(base_value = explainer.expected_value,
                 shap_values = shap_values_row,
                 features = X_test_sample.iloc[row, :],
@@ -967,6 +996,12 @@ shap.decision_plot(base_value = explainer.expected_value,
 - [One-hot](https://en.wikipedia.org/wiki/One-hot)
 """
 
+# Time and memory usage of each stage, also written to stages.json (compared with a baseline by python -m src.instrumentation compare)
+recorder.end()
+recorder.save('stages.json')
+print(recorder.report().to_string())
+print(" ")
+
 # Runtime and memory usage
 stop = time.time()
 process = psutil.Process(os.getpid())
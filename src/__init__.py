@@ -0,0 +1 @@
+"""Patient Survival Prediction - reusable components of the notebook pipeline."""
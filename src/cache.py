@@ -0,0 +1,132 @@
+"""Columnar on-disk cache of the cleaned, typed dataset.
+
+The cleaned frame (schema dtypes, with the constant and identifier columns dropped) is
+written to an uncompressed Feather file whose name carries a hash of the content of
+the source CSV and of the cleaning configuration. Later runs memory-map that file
+instead of parsing the CSV; when the source or the configuration changes the hash
+changes too, and the stale entries of that source are removed. The manifest of the
+cache directory records the digest of every source and the source of every entry, so
+that sources with the same file name in different directories do not evict each other.
+
+    python -m src.cache content/Dataset.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from .ingestion import read_dataset, schema_dtypes
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 1
+
+# Columns dropped in the notebook: the constant readmission_status and the per-encounter identifiers
+DROPPED_COLUMNS = ('readmission_status', 'encounter_id', 'patient_id')
+
+
+# Function to hash the content of a file, without reading it into memory at once
+def file_digest(path, block_size = 1 << 20):
+    digest = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to read the manifest of a cache directory: the digest of every source and the source of every entry
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    return {'sources': manifest.get('sources', {}), 'entries': manifest.get('entries', {})}
+
+
+# Function to write the manifest of a cache directory
+def _write_manifest(manifest, cache_dir):
+    with open(os.path.join(cache_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent = 2)
+
+
+# Function to hash a file, reusing the digest recorded for it as long as its size and mtime are unchanged
+def _source_digest(path, cache_dir):
+    manifest = _read_manifest(cache_dir)
+    stat = os.stat(path)
+    entry = manifest['sources'].get(os.path.abspath(path))
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['digest']
+    digest = file_digest(path)
+    manifest['sources'][os.path.abspath(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+    _write_manifest(manifest, cache_dir)
+    return digest
+
+
+# Function to compute the cache key of a source file and a cleaning configuration
+def cache_key(path, config, cache_dir = CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok = True)
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update(_source_digest(path, cache_dir).encode())
+    digest.update(json.dumps(config, sort_keys = True).encode())
+    return digest.hexdigest()
+
+
+# Function to clean the dataset as the notebook does
+def clean_dataset(path, dictionary = None, drop = DROPPED_COLUMNS):
+    df = read_dataset(path, dictionary)
+    return df.drop(columns = [col for col in drop if col in df.columns])
+
+
+# Function to load the cleaned dataset, from the cache when it is up to date
+def load_clean_dataset(path, dictionary = None, drop = DROPPED_COLUMNS, cache_dir = CACHE_DIR):
+    config = {'version': CACHE_VERSION, 'drop': list(drop), 'dtypes': schema_dtypes(dictionary)}
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cached = os.path.join(cache_dir, f'{stem}-{cache_key(path, config, cache_dir)}.feather')
+    if os.path.exists(cached):
+        return feather.read_table(cached, memory_map = True).to_pandas(split_blocks = True)
+
+    df = clean_dataset(path, dictionary, drop)
+    tmp = cached + '.tmp'
+    feather.write_feather(df.reset_index(drop = True), tmp, compression = 'uncompressed')
+    os.replace(tmp, cached)
+
+    # Recording the source of the new entry, and removing the entries of the same source built from an older
+    # version of the file or of the configuration
+    manifest = _read_manifest(cache_dir)
+    source = os.path.abspath(path)
+    for name, entry_source in list(manifest['entries'].items()):
+        if entry_source == source and name != os.path.basename(cached):
+            if os.path.exists(os.path.join(cache_dir, name)):
+                os.remove(os.path.join(cache_dir, name))
+            del manifest['entries'][name]
+    manifest['entries'][os.path.basename(cached)] = source
+    _write_manifest(manifest, cache_dir)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Build (or refresh) the cache of the cleaned dataset.')
+    parser.add_argument('path', nargs = '?', default = 'content/Dataset.csv')
+    parser.add_argument('--cache-dir', default = CACHE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    clean_dataset(args.path)
+    parse_time = time.perf_counter() - start
+    load_clean_dataset(args.path, cache_dir = args.cache_dir)
+    start = time.perf_counter()
+    df = load_clean_dataset(args.path, cache_dir = args.cache_dir)
+    cache_time = time.perf_counter() - start
+
+    print(pd.Series({"Shape of the cleaned dataset": df.shape,
+                     "CSV parse and clean": "{:.2f} seconds".format(parse_time),
+                     "Load from cache": "{:.2f} seconds".format(cache_time)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Contingency tables between the target variable and categorical features.
+
+Every column is integer-coded once with ``pd.factorize`` and each target x feature
+table is then filled by a single ``np.bincount`` over the combined codes, instead of
+rescanning the dataframe row by row for every cell. Plotting is left to the caller.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Counts are indexed as counts[target class, feature class]
+ContingencyTable = namedtuple('ContingencyTable', ['counts', 'target_classes', 'feature_classes'])
+
+
+# Function to integer-code a column, with classes ordered by decreasing frequency (the order of value_counts)
+def frequency_codes(values):
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return codes, np.asarray(uniques)
+    counts = np.bincount(codes[codes >= 0], minlength = len(uniques))
+    order = np.argsort(-counts, kind = 'stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    codes = np.where(codes >= 0, rank[np.maximum(codes, 0)], -1)
+    return codes, np.asarray(uniques)[order]
+
+
+# Function to compute the contingency table of a target and a single feature from integer codes
+def _table(target_codes, target_classes, feature_codes, feature_classes):
+    k, m = len(target_classes), len(feature_classes)
+    valid = (target_codes >= 0) & (feature_codes >= 0)
+    counts = np.bincount(target_codes[valid]*m + feature_codes[valid], minlength = k*m)
+    return ContingencyTable(counts.reshape(k, m), target_classes, feature_classes)
+
+
+# Function to compute the contingency tables of a target variable against several features
+def contingency_tables(df, target, cols):
+    target_codes, target_classes = frequency_codes(df[target])
+    tables = {}
+    for col in cols:
+        feature_codes, feature_classes = frequency_codes(df[col])
+        tables[col] = _table(target_codes, target_classes, feature_codes, feature_classes)
+    return tables
+
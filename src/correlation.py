@@ -0,0 +1,82 @@
+"""Pairwise-complete correlation matrix and strong-correlation pairs, computed with matrix products.
+
+For two blocks of columns, the Pearson correlation of every pair over the rows where
+both values are present is obtained from a handful of matrix products of the
+zero-filled values and the 0/1 presence masks, so no pair is re-aligned or re-masked
+on its own. ``strong_pairs`` walks the upper triangle block by block and keeps only
+the pairs above the threshold, so the full matrix never has to be held in memory when
+there are too many columns for it.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# Function to get a block of columns as zero-filled, centred float64 values and their presence mask
+def _block(df, cols):
+    values = df[cols].to_numpy(dtype = np.float64, na_value = np.nan)
+    mask = ~np.isnan(values)
+    with np.errstate(invalid = 'ignore'):
+        values = values - np.nanmean(np.where(mask, values, np.nan), axis = 0) # Centring reduces cancellation
+    values[~mask] = 0.0
+    return values, mask.astype(np.float64)
+
+
+# Function to compute the pairwise-complete correlations between two blocks of columns
+def _block_corr(X, M, Y, N, min_periods = 2):
+    n = M.T @ N
+    sx, sy = X.T @ N, M.T @ Y
+    sxx, syy = (X*X).T @ N, M.T @ (Y*Y)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        cov = X.T @ Y - sx*sy/n
+        var_x = sxx - sx*sx/n
+        var_y = syy - sy*sy/n
+        corr = cov/np.sqrt(var_x*var_y)
+    # Too few common rows, or a column constant over them (up to rounding), as pandas gives NaN
+    corr[(n < min_periods) | (var_x <= 1e-12*sxx) | (var_y <= 1e-12*syy)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+# Function to split a list of columns into blocks
+def _blocks(cols, block_size):
+    return [cols[start:start + block_size] for start in range(0, len(cols), block_size)]
+
+
+# Function to compute the correlation matrix of the columns, as DataFrame.corr does
+def correlation_matrix(df, cols = None, block_size = 64, min_periods = 2):
+    cols = list(df.columns if cols is None else cols)
+    corr = np.empty((len(cols), len(cols)))
+    blocks = _blocks(cols, block_size)
+    for a, block_a in enumerate(blocks):
+        X, M = _block(df, block_a)
+        i = a*block_size
+        for b in range(a, len(blocks)):
+            Y, N = (X, M) if b == a else _block(df, blocks[b])
+            j = b*block_size
+            corr[i:i + len(block_a), j:j + len(blocks[b])] = _block_corr(X, M, Y, N, min_periods)
+            corr[j:j + len(blocks[b]), i:i + len(block_a)] = corr[i:i + len(block_a), j:j + len(blocks[b])].T
+    return pd.DataFrame(corr, index = cols, columns = cols)
+
+
+# Function to find the pairs of columns whose correlation exceeds the threshold in absolute value
+def strong_pairs(df, cols = None, threshold = 0.8, block_size = 64, min_periods = 2):
+    cols = list(df.columns if cols is None else cols)
+    names = np.asarray(cols, dtype = object)
+    if not cols:
+        return pd.Series(dtype = np.float64, index = pd.MultiIndex.from_arrays([names, names]))
+    blocks = _blocks(cols, block_size)
+    first, second, values = [], [], []
+    for a, block_a in enumerate(blocks):
+        X, M = _block(df, block_a)
+        for b in range(a, len(blocks)):
+            Y, N = (X, M) if b == a else _block(df, blocks[b])
+            corr = _block_corr(X, M, Y, N, min_periods)
+            selected = np.abs(corr) > threshold
+            if b == a:
+                selected = np.triu(selected, k = 1)
+            rows, columns = np.nonzero(selected)
+            first.append(names[a*block_size + rows])
+            second.append(names[b*block_size + columns])
+            values.append(corr[rows, columns])
+    index = pd.MultiIndex.from_arrays([np.concatenate(first), np.concatenate(second)])
+    return pd.Series(np.concatenate(values), index = index)
@@ -0,0 +1,108 @@
+"""Correlation report: a clustered overview of the correlation matrix plus annotated tiles.
+
+The features are ordered by hierarchical clustering on ``1 - |corr|``, so that
+correlated features sit next to each other. The overview draws the whole reordered
+matrix as one image (block-averaged when there are more features than
+``max_overview``), and the tiles zoom into consecutive blocks of the clustered order.
+Only the cells whose correlation exceeds the threshold in absolute value are
+annotated. All functions take an already computed correlation matrix.
+"""
+
+import math
+import os
+import warnings
+
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+
+
+# Function to order the features of a correlation matrix by average-linkage clustering on 1 - |corr|
+def cluster_order(corr):
+    distance = 1 - np.abs(np.nan_to_num(np.asarray(corr, dtype = np.float64), nan = 0.0))
+    distance = np.clip((distance + distance.T)/2, 0, None)
+    np.fill_diagonal(distance, 0)
+    if len(distance) < 3:
+        return np.arange(len(distance))
+    return leaves_list(linkage(squareform(distance, checks = False), method = 'average'))
+
+
+# Function to block-average a square matrix down to at most size x size cells
+def downsample(matrix, size):
+    factor = math.ceil(len(matrix)/size)
+    if factor <= 1:
+        return matrix, 1
+    padded = np.full((factor*math.ceil(len(matrix)/factor),)*2, np.nan)
+    padded[:len(matrix), :len(matrix)] = matrix
+    blocks = padded.reshape(len(padded)//factor, factor, len(padded)//factor, factor)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # Blocks of the padding only
+        return np.nanmean(blocks, axis = (1, 3)), factor
+
+
+# Function to draw a (block of a) correlation matrix as an image, annotating only the strong cells
+def _draw(ax, matrix, row_labels, col_labels, threshold, cmap, fontsize):
+    image = ax.imshow(matrix, cmap = cmap, vmin = -1, vmax = 1, interpolation = 'nearest', aspect = 'auto')
+    if row_labels is not None:
+        ax.set_yticks(range(len(row_labels)), row_labels, fontsize = fontsize)
+        ax.set_xticks(range(len(col_labels)), col_labels, fontsize = fontsize, rotation = 90)
+    else:
+        ax.set_xticks([])
+        ax.set_yticks([])
+    if threshold is not None:
+        with np.errstate(invalid = 'ignore'):
+            rows, cols = np.nonzero(np.abs(matrix) > threshold)
+        for i, j in zip(rows, cols):
+            if row_labels is None or row_labels[i] != col_labels[j]:
+                ax.text(j, i, "{:.2f}".format(matrix[i, j]), ha = 'center', va = 'center', fontsize = fontsize,
+                        color = 'white' if matrix[i, j] > 0.5 else 'black') # CMRmap_r is dark towards +1
+    return image
+
+
+# Function to plot the clustered correlation matrix as a single image
+def plot_overview(corr, order = None, max_overview = 256, cmap = plt.cm.CMRmap_r, size = 12, ax = None):
+    order = cluster_order(corr) if order is None else order
+    matrix, factor = downsample(corr.to_numpy()[np.ix_(order, order)], max_overview)
+    if ax is None:
+        fig, ax = plt.subplots(figsize = (size, size*0.8))
+    labels = corr.columns[order].tolist() if factor == 1 and len(order) <= 80 else None
+    image = _draw(ax, matrix, labels, labels, None, cmap, 6)
+    ax.figure.colorbar(image, ax = ax, shrink = 0.8)
+    title = "Correlation matrix ({} features, clustered order".format(len(order))
+    ax.set_title(title + (", {}x{} blocks averaged)".format(factor, factor) if factor > 1 else ")"))
+    return ax.figure
+
+
+# Function to plot one tile of the clustered correlation matrix
+def plot_tile(corr, rows, cols, threshold = 0.9, cmap = plt.cm.CMRmap_r, cell_size = 0.4):
+    matrix = corr.to_numpy()[np.ix_(rows, cols)]
+    fig, ax = plt.subplots(figsize = (max(4, cell_size*len(cols) + 2), max(3, cell_size*len(rows) + 1.5)))
+    image = _draw(ax, matrix, corr.index[rows].tolist(), corr.columns[cols].tolist(), threshold, cmap, 6)
+    fig.colorbar(image, ax = ax, shrink = 0.8)
+    return fig
+
+
+# Function to split the clustered order into tiles: the diagonal blocks, or every block pair
+def tiles(order, tile_size = 40, diagonal_only = True):
+    blocks = [order[start:start + tile_size] for start in range(0, len(order), tile_size)]
+    for a in range(len(blocks)):
+        for b in ([a] if diagonal_only else range(a, len(blocks))):
+            yield blocks[a], blocks[b]
+
+
+# Function to render the whole report; figures are saved and closed when output_dir is given, so memory stays bounded
+def correlation_report(corr, threshold = 0.9, tile_size = 40, max_overview = 256, diagonal_only = True,
+                       output_dir = None, dpi = 100):
+    order = cluster_order(corr)
+    figures = (plot_overview(corr, order, max_overview = max_overview) if i == 0 else plot_tile(corr, *tile, threshold = threshold)
+               for i, tile in enumerate([None] + list(tiles(order, tile_size, diagonal_only))))
+    if output_dir is None:
+        return list(figures)
+    os.makedirs(output_dir, exist_ok = True)
+    paths = []
+    for i, fig in enumerate(figures):
+        paths.append(os.path.join(output_dir, 'overview.png' if i == 0 else f'tile_{i:03d}.png'))
+        fig.savefig(paths[-1], dpi = dpi, bbox_inches = 'tight')
+        plt.close(fig)
+    return paths
@@ -0,0 +1,143 @@
+"""Parallel K-fold cross-validation of the Dense network.
+
+The folds of a seeded ``KFold`` split of the cleaned dataset are trained concurrently
+in a pool of spawned worker processes. Each worker is pinned to its own slice of
+cores, with a TensorFlow thread budget. Every fold fits its own preprocessing pipeline
+on its training part only, so nothing leaks from the held-out part. The fold then
+trains the hypermodel with fixed hyperparameters, keeping the weights of the best
+epoch, and reports the held-out metrics. The metrics are summarized by their mean and
+standard deviation across folds, and the wall-clock time can be compared with that of
+the same folds run one after the other.
+
+    python -m src.cross_validation content/Dataset.csv --folds 5 --units 256 --learning-rate 0.001 --compare-serial
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+
+from .cache import CACHE_DIR, load_clean_dataset
+from .tuning import limit_threads
+
+TARGET = 'hospital_death'
+
+
+# Initializer of a worker process: takes a slice of cores and limits TensorFlow to it
+def _init_worker(cpu_slices, threads):
+    cpus = cpu_slices.get() if cpu_slices is not None else None
+    limit_threads(threads, cpus)
+
+
+# Function to train and evaluate the network on one fold (run in a worker process)
+def _run_fold(fold, train_index, test_index, data_path, cache_dir, units, learning_rate, epochs, patience, batch_size, seed):
+    import keras_tuner as kt
+    import tensorflow as tf
+    from .evaluation import evaluation_report
+    from .ingestion import column_groups
+    from .input_pipeline import fit_datasets, make_dataset
+    from .models import make_model_builder
+    from .preprocessing import PreprocessingPipeline
+    from .training import train_best_epoch
+
+    start = time.perf_counter()
+    if seed is not None:
+        tf.keras.utils.set_random_seed(seed + fold)
+    data = load_clean_dataset(data_path, cache_dir = cache_dir)
+    X, y = data.drop(TARGET, axis = 1), data[TARGET].to_numpy(dtype = np.float32)
+
+    # Preprocessing learnt from the training part of the fold only
+    preprocessor = PreprocessingPipeline(cols_object = column_groups(X)[2], random_state = seed).fit(X.iloc[train_index])
+    X_train, X_test = preprocessor.transform(X.iloc[train_index]), preprocessor.transform(X.iloc[test_index])
+    y_train, y_test = y[train_index], y[test_index]
+
+    hyperparameters = kt.HyperParameters()
+    hyperparameters.Fixed('units', units)
+    hyperparameters.Fixed('learning_rate', learning_rate)
+    model = make_model_builder(X_train.shape[1])(hyperparameters)
+    train, validation = fit_datasets(X_train, y_train, validation_split = 0.2, batch_size = batch_size, seed = seed)
+    model, _, best_epoch = train_best_epoch(model, train, validation, epochs = epochs, patience = patience, verbose = 0)
+
+    probabilities = model.predict(make_dataset(X_test, batch_size = 8192), verbose = 0)[:, 0]
+    report = evaluation_report(y_test, probabilities, threshold = 0.5)
+    return {'fold': fold + 1,
+            'accuracy': report["Accuracy"],
+            'roc_auc': report["ROC-AUC"],
+            'pr_auc': report["PR-AUC"],
+            'precision': report["Precision"],
+            'recall': report["Recall"],
+            'f1': report["F1-score"],
+            'best_epoch': best_epoch,
+            'fold_seconds': time.perf_counter() - start}
+
+
+# Function to cross-validate the network; returns the metrics of every fold and the wall-clock time
+def cross_validate(data_path, n_splits = 5, workers = None, threads_per_worker = None, units = 256, learning_rate = 0.001,
+                   epochs = 50, patience = 10, batch_size = 32, seed = 0, cache_dir = CACHE_DIR):
+    # The cache is built once here, so the workers only memory-map it
+    n = len(load_clean_dataset(data_path, cache_dir = cache_dir))
+    folds = list(KFold(n_splits = n_splits, shuffle = True, random_state = seed).split(np.arange(n)))
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    workers = min(workers or len(cores), n_splits)
+    threads_per_worker = threads_per_worker or max(1, len(cores)//workers)
+    context = mp.get_context('spawn') # TensorFlow is not fork-safe
+    cpu_slices = context.Queue()
+    for i in range(workers):
+        cpu_slices.put([cores[(i*threads_per_worker + k) % len(cores)] for k in range(threads_per_worker)])
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = _init_worker,
+                             initargs = (cpu_slices, threads_per_worker)) as executor:
+        futures = [executor.submit(_run_fold, fold, train_index, test_index, data_path, cache_dir, units, learning_rate,
+                                   epochs, patience, batch_size, seed)
+                   for fold, (train_index, test_index) in enumerate(folds)]
+        results = [future.result() for future in futures]
+    return pd.DataFrame(results).set_index('fold'), time.perf_counter() - start
+
+
+# Function to summarize the fold metrics by their mean and standard deviation
+def summarize_folds(folds):
+    metrics = folds.drop(columns = ['fold_seconds'])
+    return pd.DataFrame({'mean': metrics.mean(), 'std': metrics.std(ddof = 1)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Parallel K-fold cross-validation of the Dense network.')
+    parser.add_argument('data', nargs = '?', default = 'content/Dataset.csv')
+    parser.add_argument('--folds', type = int, default = 5)
+    parser.add_argument('--workers', type = int, default = None, help = 'defaults to one per core (at most one per fold)')
+    parser.add_argument('--threads-per-worker', type = int, default = None)
+    parser.add_argument('--units', type = int, default = 256)
+    parser.add_argument('--learning-rate', type = float, default = 0.001)
+    parser.add_argument('--epochs', type = int, default = 50)
+    parser.add_argument('--patience', type = int, default = 10)
+    parser.add_argument('--batch-size', type = int, default = 32)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--cache-dir', default = CACHE_DIR)
+    parser.add_argument('--compare-serial', action = 'store_true', help = 'also time the folds run one after the other')
+    args = parser.parse_args()
+
+    config = dict(n_splits = args.folds, units = args.units, learning_rate = args.learning_rate, epochs = args.epochs,
+                  patience = args.patience, batch_size = args.batch_size, seed = args.seed, cache_dir = args.cache_dir)
+    folds, parallel_time = cross_validate(args.data, workers = args.workers, threads_per_worker = args.threads_per_worker, **config)
+    print(folds.to_string())
+    print(" ")
+    print(summarize_folds(folds).to_string())
+    print(" ")
+    report = {"Parallel folds": "{:.1f} seconds".format(parallel_time)}
+    if args.compare_serial:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        _, serial_time = cross_validate(args.data, workers = 1, threads_per_worker = cores, **config)
+        report["Serial folds"] = "{:.1f} seconds".format(serial_time)
+        report["Speedup"] = "{:.2f}x".format(serial_time/parallel_time)
+    print(pd.Series(report).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Per-column statistics of a dataset, computed once and queried by the EDA helpers.
+
+``DatasetProfile`` counts the values of every column in one pass, with blocks of
+columns spread over a thread pool, and keeps the number of distinct values, the number
+of missing values, the mode and its frequency, the minimum and maximum, and the kind
+of the dtype of every column. It can also be built from chunks of a file that does not
+fit in memory, since the value counts of the chunks are merged.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+STATISTICS = ['kind', 'nunique', 'missing', 'mode', 'mode_count', 'min', 'max']
+
+
+# Function to classify a dtype as 'bool', 'integer', 'float' or 'categorical'
+def dtype_kind(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float'
+    return 'categorical'
+
+
+# Function to count the observed values and the missing values of a column
+def _column_counts(series):
+    counts = series.value_counts(dropna = True, sort = False)
+    counts = counts[counts > 0] # Unobserved categories
+    if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+        counts.index = pd.Index(np.asarray(counts.index, dtype = object))
+    return counts, int(series.isna().sum())
+
+
+# Function to count the values of a block of columns
+def _block_counts(df, cols):
+    return {col: _column_counts(df[col]) for col in cols}
+
+
+# Function to count the values of all columns of a dataframe, with blocks of columns on a thread pool
+def _frame_counts(df, executor, workers):
+    blocks = [block.tolist() for block in np.array_split(np.asarray(df.columns, dtype = object), workers) if len(block)]
+    counts = {}
+    for result in executor.map(lambda cols: _block_counts(df, cols), blocks):
+        counts.update(result)
+    return counts
+
+
+class DatasetProfile:
+
+    def __init__(self, stats, n_rows):
+        self.stats = stats
+        self.n_rows = n_rows
+
+    # Function to build the profile of a dataframe
+    @classmethod
+    def from_frame(cls, df, max_workers = None):
+        return cls.from_chunks([df], max_workers = max_workers)
+
+    # Function to build the profile from an iterable of dataframes with the same columns
+    @classmethod
+    def from_chunks(cls, chunks, max_workers = None):
+        workers = max_workers or min(32, os.cpu_count() or 1)
+        counts, missing, kinds, n_rows = {}, {}, {}, 0
+        with ThreadPoolExecutor(max_workers = workers) as executor:
+            for chunk in chunks:
+                n_rows += len(chunk)
+                for col, (col_counts, col_missing) in _frame_counts(chunk, executor, workers).items():
+                    if col in counts:
+                        counts[col] = counts[col].add(col_counts, fill_value = 0)
+                        missing[col] += col_missing
+                    else:
+                        counts[col], missing[col], kinds[col] = col_counts, col_missing, dtype_kind(chunk[col].dtype)
+
+        rows = {}
+        for col, col_counts in counts.items():
+            observed = len(col_counts) > 0
+            numerical = kinds[col] != 'categorical' and observed
+            rows[col] = [kinds[col],
+                         len(col_counts),
+                         missing[col],
+                         col_counts.idxmax() if observed else np.nan,
+                         int(col_counts.max()) if observed else 0,
+                         col_counts.index.min() if numerical else np.nan,
+                         col_counts.index.max() if numerical else np.nan]
+        stats = pd.DataFrame.from_dict(rows, orient = 'index', columns = STATISTICS)
+        return cls(stats, n_rows)
+
+    @property
+    def nunique(self):
+        return self.stats['nunique']
+
+    @property
+    def missing(self):
+        return self.stats['missing']
+
+    # Function to compute the proportion of missing values of every column
+    def missing_proportion(self):
+        return self.stats['missing']/self.n_rows
+
+    # Function to list the columns with at least one missing value
+    def columns_with_missing(self):
+        return self.stats.index[self.stats['missing'] > 0].tolist()
+
+    # Function to list the columns taking a single value
+    def constant(self):
+        return self.stats.index[self.stats['nunique'] == 1].tolist()
+
+    # Function to list the columns taking exactly two values
+    def binary(self):
+        return self.stats.index[self.stats['nunique'] == 2].tolist()
+
+    # Function to list the columns whose number of distinct values lies in [min_unique, max_unique] and whose dtype kind matches
+    def select(self, min_unique = None, max_unique = None, kind = None, exclude_kind = None):
+        mask = pd.Series(True, index = self.stats.index)
+        if min_unique is not None:
+            mask &= self.stats['nunique'] >= min_unique
+        if max_unique is not None:
+            mask &= self.stats['nunique'] <= max_unique
+        if kind is not None:
+            mask &= self.stats['kind'] == kind
+        if exclude_kind is not None:
+            mask &= self.stats['kind'] != exclude_kind
+        return self.stats.index[mask].tolist()
+
+    # Function to compute the relative frequencies of the modes above a threshold, in decreasing order
+    def almost_constant(self, threshold = 0.9):
+        mode_rel_freq = self.stats['mode_count']/self.n_rows
+        return mode_rel_freq[mode_rel_freq > threshold].sort_values(ascending = False)
+
+    # Function to get the profile without some columns, as DataFrame.drop does
+    def drop(self, cols):
+        return DatasetProfile(self.stats.drop(cols), self.n_rows)
@@ -0,0 +1,95 @@
+"""Fixed-vocabulary categorical encoder.
+
+The vocabularies of the categorical columns are learnt from the training set only
+(sorted, as ``pd.get_dummies`` orders its dummies), so every later batch is encoded
+on its own, without concatenating it with the training data. Categories that were not
+seen in training go to an ``__unknown__`` bucket; missing values are left as all-zero
+rows. The one-hot block can be written straight into a slice of a preallocated
+feature matrix or returned as a scipy sparse matrix, and the same vocabularies give
+consistent integer label codes for train, test and production batches.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+UNKNOWN = '__unknown__'
+
+
+class CategoricalEncoder:
+
+    def __init__(self, drop_first = False, unknown_bucket = True):
+        self.drop_first = drop_first
+        self.unknown_bucket = unknown_bucket
+
+    # Learning the sorted vocabulary of every categorical column from the training set
+    def fit(self, X, cols):
+        vocabularies = {}
+        for col in cols:
+            values = X[col].dropna()
+            values = values.cat.remove_unused_categories() if isinstance(values.dtype, pd.CategoricalDtype) else values
+            vocabularies[col] = np.sort(pd.unique(np.asarray(values, dtype = object).astype(str)))
+        return self.set_vocabularies(vocabularies)
+
+    # Setting vocabularies learnt elsewhere (e.g. by the imputer), as arrays of strings
+    def set_vocabularies(self, vocabularies):
+        self.vocabularies_ = {col: np.sort(np.asarray(vocabulary).astype(str)) for col, vocabulary in vocabularies.items()}
+        self.columns_ = list(self.vocabularies_)
+        self.widths_ = [len(vocabulary) - int(self.drop_first) + int(self.unknown_bucket)
+                        for vocabulary in self.vocabularies_.values()]
+        self.offsets_ = np.concatenate([[0], np.cumsum(self.widths_)]).astype(np.int64)
+        self.feature_names_ = []
+        for col, vocabulary in self.vocabularies_.items():
+            self.feature_names_ += [f'{col}_{value}' for value in vocabulary[int(self.drop_first):]]
+            self.feature_names_ += [f'{col}_{UNKNOWN}'] if self.unknown_bucket else []
+        return self
+
+    # Function to compute the label codes of one column: 0..k-1 for the vocabulary, k for unknown, -1 for missing
+    def _codes(self, values, col):
+        vocabulary = self.vocabularies_[col]
+        values = np.asarray(values, dtype = object)
+        missing = pd.isna(values)
+        codes = pd.Index(vocabulary).get_indexer(values.astype(str))
+        codes[codes < 0] = len(vocabulary)
+        codes[missing] = -1
+        return codes
+
+    # Function to compute the label codes of the categorical columns, consistent across batches
+    def label_codes(self, X):
+        codes = {col: self._codes(X[col], col) for col in self.columns_}
+        return pd.DataFrame(codes, index = X.index)
+
+    # Function to compute, for every column, the one-hot position of each row (-1 for an all-zero row)
+    def _positions(self, X):
+        for j, col in enumerate(self.columns_):
+            codes = self._codes(X[col], col)
+            k = len(self.vocabularies_[col])
+            positions = codes - int(self.drop_first)
+            positions[codes == -1] = -1
+            positions[codes == k] = k - int(self.drop_first) if self.unknown_bucket else -1
+            yield j, positions
+
+    # One-hot encoding, written into out[:, offset:offset + n_features] when a preallocated matrix is given
+    def transform(self, X, out = None, offset = 0, dtype = np.float32, as_frame = False):
+        if out is None:
+            out = np.zeros((len(X), self.offsets_[-1]), dtype = dtype)
+            offset = 0
+        else:
+            out[:, offset:offset + self.offsets_[-1]] = 0
+        for j, positions in self._positions(X):
+            rows = np.flatnonzero(positions >= 0)
+            out[rows, offset + self.offsets_[j] + positions[rows]] = 1
+        if as_frame:
+            return pd.DataFrame(out[:, offset:offset + self.offsets_[-1]], index = X.index, columns = self.feature_names_)
+        return out
+
+    # One-hot encoding as a CSR sparse matrix
+    def transform_sparse(self, X, dtype = np.uint8):
+        rows, cols = [], []
+        for j, positions in self._positions(X):
+            valid = np.flatnonzero(positions >= 0)
+            rows.append(valid)
+            cols.append(self.offsets_[j] + positions[valid])
+        rows = np.concatenate(rows) if rows else np.array([], dtype = np.int64)
+        cols = np.concatenate(cols) if cols else np.array([], dtype = np.int64)
+        return sp.csr_matrix((np.ones(len(rows), dtype = dtype), (rows, cols)), shape = (len(X), self.offsets_[-1]))
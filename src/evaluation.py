@@ -0,0 +1,164 @@
+"""Threshold-sweep evaluation of predicted probabilities.
+
+``threshold_curve`` sorts the scores once and accumulates the labels, giving the
+confusion counts at every distinct score, i.e. for every threshold, in O(n log n).
+ROC-AUC and PR-AUC (average precision) are computed from those counts, as are the
+precision, recall, F1 and accuracy curves, the metrics at a given threshold and the
+optimal operating point. ``bootstrap`` resamples with multinomial weights on the
+already sorted scores, so confidence intervals for all metrics take a few vectorized
+cumulative sums per block of resamples.
+"""
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+
+class ThresholdCurve:
+
+    # Confusion counts when predicting 1 for score >= threshold, for thresholds in decreasing order (the first one is +inf)
+    def __init__(self, thresholds, tp, fp, n_pos, n_neg):
+        self.thresholds = thresholds
+        self.tp, self.fp = tp, fp
+        self.fn, self.tn = n_pos - tp, n_neg - fp
+        self.n_pos, self.n_neg = n_pos, n_neg
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            self.recall = tp/n_pos if n_pos else np.full(len(tp), np.nan)
+            self.fpr = fp/n_neg if n_neg else np.full(len(fp), np.nan)
+            self.precision = np.where(tp + fp > 0, tp/(tp + fp), 1.0) # No positive prediction: precision 1, as sklearn
+            self.f1 = np.where(tp > 0, 2*tp/(2*tp + fp + (n_pos - tp)), 0.0)
+        self.accuracy = (tp + self.tn)/(n_pos + n_neg)
+
+    # Area under the ROC curve, by the trapezoidal rule
+    def roc_auc(self):
+        return float(np.trapezoid(self.recall, self.fpr))
+
+    # Area under the precision-recall curve, as average precision (step-wise, as sklearn)
+    def pr_auc(self):
+        return float(np.sum(np.diff(self.recall)*self.precision[1:]))
+
+    # Index of the operating point of a threshold: the last threshold not below it
+    def _index(self, threshold):
+        return int(np.searchsorted(-self.thresholds, -threshold, side = 'right')) - 1
+
+    # Metrics of the hard predictions at a threshold
+    def metrics_at(self, threshold = 0.5):
+        i = self._index(threshold)
+        return pd.Series({"Threshold": threshold,
+                          "Accuracy": self.accuracy[i],
+                          "Precision": self.precision[i] if self.tp[i] + self.fp[i] > 0 else 0.0,
+                          "Recall": self.recall[i],
+                          "F1-score": self.f1[i],
+                          "Specificity": 1 - self.fpr[i]})
+
+    # Confusion matrix at a threshold, rows and columns ordered as the labels 0 and 1
+    def confusion_matrix(self, threshold = 0.5):
+        i = self._index(threshold)
+        return np.array([[self.tn[i], self.fp[i]], [self.fn[i], self.tp[i]]])
+
+    # Optimal operating point, maximizing the F1-score or Youden's J (recall - false positive rate)
+    def optimal_threshold(self, criterion = 'f1'):
+        if criterion == 'f1':
+            values = self.f1
+        elif criterion == 'youden':
+            values = self.recall - self.fpr
+        else:
+            raise ValueError(f"'{criterion}' is not a valid argument for the parameter criterion. Use 'f1' or 'youden'.")
+        i = int(np.nanargmax(values[1:])) + 1 # The +inf threshold predicts no positive
+        return float(self.thresholds[i])
+
+    # Curves as a dataframe indexed by threshold
+    def to_frame(self):
+        return pd.DataFrame({'tp': self.tp, 'fp': self.fp, 'fn': self.fn, 'tn': self.tn, 'precision': self.precision,
+                             'recall': self.recall, 'fpr': self.fpr, 'f1': self.f1, 'accuracy': self.accuracy},
+                            index = pd.Index(self.thresholds, name = 'threshold'))
+
+
+# Function to sort the scores once; returns the order, the sorted scores and the positions where the score changes
+def _sort(scores):
+    order = np.argsort(-scores, kind = 'mergesort')
+    sorted_scores = scores[order]
+    ends = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(scores) - 1] # Last position of every distinct score
+    return order, sorted_scores, ends
+
+
+# Function to compute the confusion counts at every threshold
+def threshold_curve(y_true, scores):
+    y_true = np.asarray(y_true).ravel().astype(np.int64)
+    scores = np.asarray(scores, dtype = np.float64).ravel()
+    order, sorted_scores, ends = _sort(scores)
+    tp = np.r_[0, np.cumsum(y_true[order])[ends]]
+    fp = np.r_[0, ends + 1] - tp
+    thresholds = np.r_[np.inf, sorted_scores[ends]]
+    return ThresholdCurve(thresholds, tp, fp, int(y_true.sum()), int(len(y_true) - y_true.sum()))
+
+
+# Function to evaluate probabilities at a threshold, with the threshold-free ROC-AUC and PR-AUC
+def evaluation_report(y_true, scores, threshold = 0.5, curve = None):
+    curve = threshold_curve(y_true, scores) if curve is None else curve
+    report = curve.metrics_at(threshold)
+    report["ROC-AUC"] = curve.roc_auc()
+    report["PR-AUC"] = curve.pr_auc()
+    return report[["Threshold", "Accuracy", "ROC-AUC", "PR-AUC", "Precision", "Recall", "F1-score", "Specificity"]]
+
+
+# Function to compute bootstrap confidence intervals of the metrics, resampling rows with multinomial weights
+def bootstrap(y_true, scores, n_resamples = 1000, threshold = 0.5, alpha = 0.05, block_size = 100, seed = None):
+    y_true = np.asarray(y_true).ravel().astype(np.int64)
+    scores = np.asarray(scores, dtype = np.float64).ravel()
+    n = len(scores)
+    order, sorted_scores, ends = _sort(scores)
+    positive = y_true[order].astype(bool)
+    cut = int(np.searchsorted(-sorted_scores, -threshold, side = 'right')) # Rows predicted positive at the threshold
+    rng = np.random.default_rng(seed)
+    results = []
+    for start in range(0, n_resamples, block_size):
+        size = min(block_size, n_resamples - start)
+        weights = rng.multinomial(n, np.full(n, 1/n), size = size)[:, order].astype(np.float64)
+        tp_all = np.cumsum(weights*positive, axis = 1)
+        fp_all = np.cumsum(weights*~positive, axis = 1)
+        n_pos, n_neg = tp_all[:, -1:], fp_all[:, -1:]
+        tp = np.c_[np.zeros(size), tp_all[:, ends]]
+        fp = np.c_[np.zeros(size), fp_all[:, ends]]
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            recall, fpr = tp/n_pos, fp/n_neg
+            precision = np.where(tp + fp > 0, tp/(tp + fp), 1.0)
+            tp_t = tp_all[:, cut - 1] if cut > 0 else np.zeros(size)
+            fp_t = fp_all[:, cut - 1] if cut > 0 else np.zeros(size)
+            results.append(pd.DataFrame({
+                "Accuracy": (tp_t + n_neg[:, 0] - fp_t)/n,
+                "ROC-AUC": np.trapezoid(recall, fpr, axis = 1),
+                "PR-AUC": np.sum(np.diff(recall, axis = 1)*precision[:, 1:], axis = 1),
+                "Precision": np.where(tp_t + fp_t > 0, tp_t/(tp_t + fp_t), 0.0),
+                "Recall": tp_t/n_pos[:, 0],
+                "F1-score": 2*tp_t/(tp_t + fp_t + n_pos[:, 0])}))
+    resamples = pd.concat(results, ignore_index = True)
+    estimate = evaluation_report(y_true, scores, threshold)[resamples.columns]
+    return pd.DataFrame({'estimate': estimate,
+                         f'{100*alpha/2:g}%': resamples.quantile(alpha/2),
+                         f'{100*(1 - alpha/2):g}%': resamples.quantile(1 - alpha/2)})
+
+
+# Function to plot the ROC curve, the precision-recall curve and the metrics against the threshold
+def plot_curves(curve, threshold = None, height = 4.5, width = 5):
+    fig, ax = plt.subplots(1, 3, figsize = (3*width, height))
+    ax[0].plot(curve.fpr, curve.recall, label = "ROC-AUC = {:.3f}".format(curve.roc_auc()))
+    ax[0].plot([0, 1], [0, 1], linestyle = '--', color = 'grey')
+    ax[0].set_xlabel("False positive rate")
+    ax[0].set_ylabel("True positive rate")
+    ax[1].step(curve.recall, curve.precision, where = 'post', label = "PR-AUC = {:.3f}".format(curve.pr_auc()))
+    ax[1].set_xlabel("Recall")
+    ax[1].set_ylabel("Precision")
+    finite = np.isfinite(curve.thresholds)
+    for name in ['precision', 'recall', 'f1']:
+        ax[2].plot(curve.thresholds[finite], getattr(curve, name)[finite], label = name)
+    ax[2].set_xlabel("Threshold")
+    if threshold is not None:
+        i = curve._index(threshold)
+        ax[0].scatter(curve.fpr[i], curve.recall[i], color = 'black', zorder = 3, label = "threshold = {:.3f}".format(threshold))
+        ax[1].scatter(curve.recall[i], curve.precision[i], color = 'black', zorder = 3, label = "threshold = {:.3f}".format(threshold))
+        ax[2].axvline(threshold, linestyle = '--', color = 'black')
+    for axis in ax:
+        axis.legend()
+    plt.tight_layout()
+    return fig
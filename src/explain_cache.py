@@ -0,0 +1,134 @@
+"""On-disk store of SHAP explanations, so that no row is explained twice.
+
+Explanations are keyed by a hash of the explainer (the weights of the model, the
+background rows, the explanation method and its options) and a hash of the float32
+feature row. They are kept in a SQLite file with the expected value of every
+explainer. ``CachedExplainer`` wraps an explainer of ``src.explain``: it serves the rows
+already in the store, computes the missing ones in a single batch, and evicts the
+least recently used rows once the store holds more than ``max_rows``.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from .numpy_model import NumpyMLP
+
+STORE_PATH = 'explanations.sqlite'
+
+
+# Function to hash the explainer: method, options, background rows and model weights
+def explainer_digest(explainer, **options):
+    model = getattr(explainer, 'model', None)
+    if model is None:
+        model = getattr(getattr(explainer, 'predict', None), '__self__', None) # Bound predict of a NumpyMLP
+    if not isinstance(model, NumpyMLP):
+        raise ValueError("Only explainers of a NumpyMLP can be hashed; pass model_key to identify the model")
+    digest = hashlib.blake2b(digest_size = 16)
+    digest.update(json.dumps({'method': type(explainer).__name__, 'options': options,
+                              'activations': model.activations}, sort_keys = True, default = str).encode())
+    for array in model.kernels + model.biases + [explainer.background]:
+        digest.update(np.ascontiguousarray(array, dtype = np.float32).tobytes())
+    return digest.hexdigest()
+
+
+# Function to hash every row of a float32 matrix
+def row_digests(X):
+    X = np.ascontiguousarray(X, dtype = np.float32)
+    return [hashlib.blake2b(row.tobytes(), digest_size = 16).hexdigest() for row in X]
+
+
+class ExplanationStore:
+
+    def __init__(self, path = STORE_PATH, max_rows = 1000000):
+        self.path = path
+        self.max_rows = max_rows
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS explainers (explainer TEXT PRIMARY KEY, expected_value REAL);
+            CREATE TABLE IF NOT EXISTS explanations (explainer TEXT, row TEXT, shap_values BLOB, last_used INTEGER,
+                                                     PRIMARY KEY (explainer, row));
+            CREATE INDEX IF NOT EXISTS explanations_last_used ON explanations (last_used);""")
+
+    def expected_value(self, explainer):
+        result = self.connection.execute("SELECT expected_value FROM explainers WHERE explainer = ?", (explainer,)).fetchone()
+        return None if result is None else result[0]
+
+    def set_expected_value(self, explainer, value):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO explainers VALUES (?, ?)", (explainer, float(value)))
+
+    # Stored SHAP values of rows, as a dictionary from row hash to vector; marks them as used
+    def get(self, explainer, rows, block_size = 500):
+        found, now = {}, time.time_ns()
+        with self.connection:
+            for start in range(0, len(rows), block_size): # SQLite limits the number of query parameters
+                block = rows[start:start + block_size]
+                query = f"SELECT row, shap_values FROM explanations WHERE explainer = ? AND row IN ({','.join('?'*len(block))})"
+                for row, values in self.connection.execute(query, [explainer] + block):
+                    found[row] = np.frombuffer(values, dtype = np.float64)
+                self.connection.execute(f"UPDATE explanations SET last_used = ? WHERE explainer = ? AND row IN ({','.join('?'*len(block))})",
+                                        [now, explainer] + block)
+        return found
+
+    # Storing the SHAP values of rows, then evicting the least recently used rows beyond max_rows
+    def put(self, explainer, rows, shap_values):
+        now = time.time_ns()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO explanations VALUES (?, ?, ?, ?)",
+                                        [(explainer, row, np.asarray(values, dtype = np.float64).tobytes(), now)
+                                         for row, values in zip(rows, shap_values)])
+            excess = len(self) - self.max_rows
+            if excess > 0:
+                self.connection.execute("""DELETE FROM explanations WHERE rowid IN
+                                           (SELECT rowid FROM explanations ORDER BY last_used LIMIT ?)""", (excess,))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM explanations")
+            self.connection.execute("DELETE FROM explainers")
+
+    def close(self):
+        self.connection.close()
+
+
+class CachedExplainer:
+
+    def __init__(self, explainer, store, model_key = None, **options):
+        self.explainer = explainer
+        self.store = store
+        self.options = options # Passed to explainer.shap_values, e.g. nsamples and seed of Kernel SHAP
+        self.key = model_key if model_key is not None else explainer_digest(explainer, **options)
+        self.hits = self.misses = 0
+        if store.expected_value(self.key) is None:
+            store.set_expected_value(self.key, explainer.expected_value)
+
+    @property
+    def expected_value(self):
+        return self.store.expected_value(self.key)
+
+    # SHAP values of rows (or of a single row); only the rows missing from the store are explained, in one batch
+    def shap_values(self, X):
+        X = np.asarray(X.to_numpy(dtype = np.float32) if hasattr(X, 'to_numpy') else X, dtype = np.float32)
+        single = X.ndim == 1
+        X = X[None, :] if single else X
+        rows = row_digests(X)
+        found = self.store.get(self.key, list(dict.fromkeys(rows)))
+        missing = {}
+        for i, row in enumerate(rows):
+            if row not in found:
+                missing.setdefault(row, i) # Duplicated rows are explained once
+        self.hits += len(rows) - sum(row in missing for row in rows)
+        self.misses += len(missing)
+        if missing:
+            computed = np.asarray(self.explainer.shap_values(X[list(missing.values())], **self.options), dtype = np.float64)
+            self.store.put(self.key, list(missing), computed)
+            found.update(zip(missing, computed))
+        values = np.stack([found[row] for row in rows])
+        return values[0] if single else values
@@ -0,0 +1,91 @@
+"""Proportion-based imputation.
+
+Missing values of a column are drawn from the values observed in that column, with
+the probabilities they were observed with, so that the distribution of every feature
+is roughly the same before and after imputation. The distributions are learnt once
+(the numerical columns in a single column-wise sort of the whole block), can be
+accumulated over chunks of a larger file, and are reused on new data; only as many
+values are drawn as there are missing cells, written in place.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class ProportionImputer:
+
+    def __init__(self, random_state = None):
+        self.random_state = random_state
+
+    # Learning the observed values and their cumulative proportions for every column
+    def fit(self, df):
+        self.__dict__.pop('counts_', None)
+        return self.partial_fit(df)
+
+    # Accumulating the observed values of a further chunk of rows
+    def partial_fit(self, df):
+        if not hasattr(self, 'counts_'):
+            self.columns_ = df.columns.tolist()
+            self.values_ = {}
+            self.counts_ = {}
+            self.cdf_ = {}
+            self.rng_ = np.random.default_rng(self.random_state)
+
+        numerical = [col for col in self.columns_ if pd.api.types.is_numeric_dtype(df[col])]
+        block = df[numerical].to_numpy(dtype = np.float64, na_value = np.nan, copy = True)
+        block.sort(axis = 0) # NaN values are sorted last
+        observed = (~np.isnan(block)).sum(axis = 0)
+        for j, col in enumerate(numerical):
+            x = block[:observed[j], j]
+            starts = np.flatnonzero(np.r_[True, x[1:] != x[:-1]]) if len(x) else np.array([], dtype = int)
+            self._update(col, x[starts], np.diff(np.r_[starts, len(x)]))
+
+        for col in self.columns_:
+            if col not in numerical:
+                counts = df[col].value_counts(sort = False)
+                counts = counts[counts > 0] # Unobserved categories of categorical columns
+                self._update(col, counts.index.to_numpy(), counts.to_numpy())
+        return self
+
+    # Function to merge the value counts of a column with those accumulated so far
+    def _update(self, col, values, counts):
+        if col in self.counts_ and len(self.counts_[col]):
+            values, inverse = np.unique(np.concatenate([self.values_[col], values]), return_inverse = True)
+            counts = np.bincount(inverse.ravel(), weights = np.concatenate([self.counts_[col], counts])).astype(np.int64)
+        self.values_[col] = values
+        self.counts_[col] = counts
+        self.cdf_[col] = np.cumsum(counts)/max(counts.sum(), 1)
+
+    # Function to draw values for the missing cells of a column, proportionately to the observed values
+    def sample(self, col, size):
+        cdf = self.cdf_[col]
+        if len(cdf) == 0:
+            raise ValueError(f"No observed values to impute column '{col}' from")
+        idx = np.searchsorted(cdf, self.rng_.random(size), side = 'right')
+        return self.values_[col][np.minimum(idx, len(cdf) - 1)]
+
+    # Imputing a 2-D array in place; columns gives the name of each array column
+    def transform_array(self, values, columns = None):
+        columns = self.columns_ if columns is None else columns
+        missing = np.isnan(values) if values.dtype.kind == 'f' else pd.isna(values)
+        for j in np.flatnonzero(missing.any(axis = 0)):
+            rows = np.flatnonzero(missing[:, j])
+            values[rows, j] = self.sample(columns[j], len(rows))
+        return values
+
+    # Imputing a dataframe; only the columns with missing values are rebuilt, one block per kind
+    def transform(self, df):
+        df_imputed = df.copy(deep = False)
+        missing_cols = df.columns[df.isna().any().to_numpy()].tolist()
+        numerical = [col for col in missing_cols if pd.api.types.is_numeric_dtype(df[col])]
+        others = [col for col in missing_cols if col not in numerical]
+        if numerical:
+            block = df[numerical].to_numpy(dtype = np.float64, na_value = np.nan, copy = True)
+            df_imputed[numerical] = self.transform_array(block, numerical)
+        if others:
+            block = df[others].to_numpy(dtype = object, copy = True)
+            df_imputed[others] = self.transform_array(block, others)
+        return df_imputed
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
@@ -0,0 +1,128 @@
+"""Schema-driven loading of the GOSSIS dataset.
+
+The data dictionary gives the data type of every variable, from which compact dtypes
+are assigned at parse time: float32 for vitals and labs, int8 for binary flags,
+int32 for identifiers and pandas categoricals for the string variables, instead of the
+int64/float64/object columns that ``pd.read_csv`` infers. The file can also be read in
+chunks, so that statistics and preprocessing fits run on files larger than RAM.
+
+    python -m src.ingestion content/Dataset.csv
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data Dictionary.csv')
+
+# Variables whose data type in the dictionary does not match the values in the dataset, and integer
+# identifiers outside the dictionary category 'identifier'
+DTYPE_OVERRIDES = {'icu_id': 'int32',
+                   'bmi': 'float32',
+                   'apache_2_diagnosis': 'float32',
+                   'apache_3j_diagnosis': 'float32'}
+
+
+# Function to load the data dictionary
+def load_dictionary(path = DICTIONARY_PATH):
+    return pd.read_csv(path)
+
+
+# Function to map every variable of the data dictionary to a compact dtype
+def schema_dtypes(dictionary = None):
+    if dictionary is None:
+        dictionary = load_dictionary()
+    dtypes = {}
+    for category, name, data_type in zip(dictionary['Category'], dictionary['Variable Name'], dictionary['Data Type']):
+        if data_type == 'string':
+            dtypes[name] = 'category'
+        elif data_type == 'integer' and category == 'identifier':
+            dtypes[name] = 'int32'
+        elif data_type == 'binary':
+            dtypes[name] = 'Int8' # Nullable, as most flags have missing values
+        else:
+            dtypes[name] = 'float32' # Integer scores, such as the GCS components, can be missing too
+    dtypes.update(DTYPE_OVERRIDES)
+    return dtypes
+
+
+# Function to compute the read_csv dtypes for a file; binary flags are parsed as float32 and narrowed afterwards,
+# and the categorical columns listed in categories get a fixed vocabulary
+def _parse_dtypes(path, dtypes, categories = None):
+    categories = categories or {}
+    columns = pd.read_csv(path, nrows = 0).columns
+    parse_dtypes = {col: ('float32' if dtypes[col] == 'Int8' else dtypes[col]) for col in columns if col in dtypes}
+    for col in columns:
+        if parse_dtypes.get(col) == 'category' and col in categories:
+            parse_dtypes[col] = pd.CategoricalDtype(categories[col])
+    return parse_dtypes
+
+
+# Function to narrow the binary flags of a parsed chunk to (nullable) 8-bit integers
+def _narrow_flags(df, dtypes, nullable = True):
+    for col in df.columns:
+        if dtypes.get(col) == 'Int8':
+            if not nullable and not df[col].isna().any():
+                df[col] = df[col].astype('int8')
+            else:
+                df[col] = df[col].astype('Int8')
+    return df
+
+
+# Function to read the vocabulary of every categorical column of a file, parsing only those columns
+def dataset_categories(path, dictionary = None):
+    dtypes = schema_dtypes(dictionary)
+    columns = [col for col in pd.read_csv(path, nrows = 0).columns if dtypes.get(col) == 'category']
+    df = pd.read_csv(path, dtype = {col: 'category' for col in columns}, usecols = columns)
+    return {col: sorted(df[col].cat.categories) for col in columns}
+
+
+# Function to read the dataset with compact dtypes, either whole or as an iterator of chunks
+def read_dataset(path, dictionary = None, chunksize = None, usecols = None, categories = None):
+    dtypes = schema_dtypes(dictionary)
+    parse_dtypes = _parse_dtypes(path, dtypes, categories)
+    if chunksize is None:
+        df = pd.read_csv(path, dtype = parse_dtypes, usecols = usecols)
+        return _narrow_flags(df, dtypes, nullable = False)
+    return _iter_chunks(pd.read_csv(path, dtype = parse_dtypes, usecols = usecols, chunksize = chunksize), dtypes)
+
+
+# Chunks keep nullable flags, so that every chunk has the same dtypes. The categories of a categorical column are
+# those present in the chunk unless the vocabulary is passed through categories (e.g. from dataset_categories), so
+# chunks with different categories are concatenated as string (object) columns
+def _iter_chunks(reader, dtypes):
+    with reader:
+        for chunk in reader:
+            yield _narrow_flags(chunk, dtypes)
+
+
+# Function to split the columns of a dataframe into integer, float and categorical columns
+def column_groups(df):
+    cols_int = [col for col in df.columns if pd.api.types.is_integer_dtype(df[col])]
+    cols_float = [col for col in df.columns if pd.api.types.is_float_dtype(df[col])]
+    cols_object = [col for col in df.columns if col not in cols_int and col not in cols_float]
+    return cols_int, cols_float, cols_object
+
+
+# Function to compare the memory footprint of the default load path with the schema-driven one
+def memory_report(path, dictionary = None, chunksize = 100000):
+    default_bytes = sum(chunk.memory_usage(deep = True).sum() for chunk in pd.read_csv(path, chunksize = chunksize))
+    compact_bytes = sum(chunk.memory_usage(deep = True).sum() for chunk in read_dataset(path, dictionary, chunksize = chunksize))
+    return pd.Series({"Default load path (MB)": default_bytes/(1024*1024),
+                      "Schema-driven load path (MB)": compact_bytes/(1024*1024),
+                      "Memory saved (MB)": (default_bytes - compact_bytes)/(1024*1024),
+                      "Reduction factor": default_bytes/max(compact_bytes, 1)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Compare the memory footprint of the default and the schema-driven load paths.')
+    parser.add_argument('path', nargs = '?', default = 'content/Dataset.csv')
+    parser.add_argument('--chunksize', type = int, default = 100000)
+    args = parser.parse_args()
+
+    print(memory_report(args.path, chunksize = args.chunksize).to_string())
+
+
+if __name__ == '__main__':
+    main()
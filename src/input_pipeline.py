@@ -0,0 +1,53 @@
+"""tf.data input pipelines for training on the preprocessed feature matrix.
+
+The matrix and the labels are converted to float32 tensors once, and every call to
+``fit`` or ``search`` then reads batches from a ``tf.data.Dataset`` built on them,
+instead of Keras converting (and copying) a DataFrame on every call. Training
+datasets are reshuffled every epoch by gathering shuffled row indices from the tensors;
+evaluation datasets are sliced in order and their batches cached in memory. All
+datasets prefetch. ``fit_datasets`` reproduces ``validation_split``: the last fraction
+of the rows, before shuffling, is held out for validation.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+
+# Function to get a contiguous float32 array, converting a DataFrame or Series only once
+def as_float32(values):
+    if hasattr(values, 'to_numpy'):
+        values = values.to_numpy(dtype = np.float32)
+    return np.ascontiguousarray(values, dtype = np.float32)
+
+
+# Function to build a batched, prefetched dataset of features (and labels) from float32 tensors
+def make_dataset(X, y = None, batch_size = 32, shuffle = False, seed = None, cache = True):
+    tensors = [tf.constant(as_float32(X))]
+    if y is not None:
+        tensors.append(tf.constant(as_float32(y)))
+    if shuffle:
+        # Only the row indices are shuffled; each batch gathers its rows from the tensors
+        n = int(tensors[0].shape[0])
+        dataset = tf.data.Dataset.range(n).shuffle(n, seed = seed, reshuffle_each_iteration = True).batch(batch_size)
+        dataset = dataset.map(lambda index: tuple(tf.gather(tensor, index) for tensor in tensors),
+                              num_parallel_calls = tf.data.AUTOTUNE, deterministic = seed is not None)
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices(tuple(tensors)).batch(batch_size)
+        if cache:
+            dataset = dataset.cache()
+    if y is None:
+        dataset = dataset.map(lambda *batch: batch[0])
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+# Function to build the training and validation datasets, from validation data or a validation split
+def fit_datasets(X, y, validation_data = None, validation_split = None, batch_size = 32, seed = None):
+    X, y = as_float32(X), as_float32(y)
+    if validation_data is None and validation_split:
+        split = int(len(X)*(1 - validation_split))
+        X, X_val, y, y_val = X[:split], X[split:], y[:split], y[split:]
+        validation_data = (X_val, y_val)
+    train = make_dataset(X, y, batch_size = batch_size, shuffle = True, seed = seed)
+    if validation_data is None:
+        return train, None
+    return train, make_dataset(*validation_data, batch_size = batch_size)
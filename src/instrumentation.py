@@ -0,0 +1,274 @@
+"""Stage-level timing and memory instrumentation of the pipeline.
+
+A ``StageRecorder`` wraps each stage of the pipeline (load, profile, split, impute,
+encode, scale, train, tune, evaluate, explain) in a context manager, or a decorator,
+and records its wall time, CPU time, resident memory at entry and exit, peak resident
+memory (sampled by a background thread) and the number of rows it processed. The
+records are written as JSON, and the stages can also be profiled with cProfile into a
+single ``.prof`` file (readable by pstats, snakeviz or speedscope).
+
+``run`` executes the pipeline on a dataset with small training budgets, so that the
+stage timings can be recorded on every change, and ``compare`` reports the stages
+that regressed against a baseline, exiting with status 1 when any did:
+
+    python -m src.instrumentation run content/Dataset.csv --output stages.json --profile stages.prof
+    python -m src.instrumentation compare baseline.json stages.json --tolerance 0.25
+"""
+
+import argparse
+import cProfile
+import functools
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import psutil
+
+MB = 1024*1024
+
+
+class _PeakSampler(threading.Thread):
+
+    # Background thread polling the resident memory of the process, to catch the peak within a stage
+    def __init__(self, process, interval):
+        super().__init__(daemon = True)
+        self.process = process
+        self.interval = interval
+        self.peak = process.memory_info().rss
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        return self.peak
+
+
+class StageRecorder:
+
+    def __init__(self, interval = 0.05, profile = False):
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+        self.profiler = cProfile.Profile() if profile else None
+        self.records = []
+        self._open = None
+        self.start = time.perf_counter()
+
+    # Context manager recording a stage; yields its record, so the rows can also be set inside the block
+    @contextmanager
+    def stage(self, name, rows = None):
+        record = {'stage': name, 'rows': rows}
+        sampler = _PeakSampler(self.process, self.interval)
+        rss_start = sampler.peak
+        sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall
+            record['cpu_seconds'] = time.process_time() - cpu
+            if self.profiler is not None:
+                self.profiler.disable()
+            peak = sampler.stop()
+            rss_end = self.process.memory_info().rss
+            record['rss_start_mb'] = rss_start/MB
+            record['rss_end_mb'] = rss_end/MB
+            record['peak_rss_delta_mb'] = (peak - rss_start)/MB
+            self.records.append(record)
+
+    # Opening a stage that spans several notebook cells; a stage still open is closed first
+    def begin(self, name, rows = None):
+        self.end()
+        manager = self.stage(name, rows)
+        self._open = (manager, manager.__enter__())
+        return self._open[1]
+
+    # Closing the open stage, optionally setting the rows it processed
+    def end(self, rows = None):
+        if self._open is not None:
+            (manager, record), self._open = self._open, None
+            if rows is not None:
+                record['rows'] = rows
+            manager.__exit__(None, None, None)
+
+    # Decorator recording every call of a function as a stage; rows is a number or a function of the result
+    def track(self, name, rows = None):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as record:
+                    result = function(*args, **kwargs)
+                    record['rows'] = rows(result) if callable(rows) else rows
+                return result
+            return wrapper
+        return decorator
+
+    def to_frame(self):
+        return pd.DataFrame(self.records).set_index('stage')
+
+    def to_dict(self):
+        return {'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'total_wall_seconds': time.perf_counter() - self.start,
+                'max_rss_mb': max([record['rss_end_mb'] for record in self.records], default = 0.0),
+                'stages': self.records}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent = 2, default = float)
+
+    # Writing the cProfile statistics of all the stages
+    def dump_profile(self, path):
+        if self.profiler is None:
+            raise ValueError("The recorder was created with profile = False")
+        self.profiler.dump_stats(path)
+
+    # Table of the stages, with the rows processed per second
+    def report(self):
+        frame = self.to_frame()
+        frame['rows_per_second'] = frame['rows']/frame['wall_seconds']
+        return frame[['rows', 'wall_seconds', 'cpu_seconds', 'peak_rss_delta_mb', 'rss_end_mb', 'rows_per_second']]
+
+
+# Function to load the stage records of a JSON file, summing repeated stages
+def load_stages(path):
+    with open(path) as f:
+        records = json.load(f)['stages']
+    return pd.DataFrame(records).groupby('stage', sort = False)[['wall_seconds', 'cpu_seconds', 'peak_rss_delta_mb']].sum()
+
+
+# Function to compare two stage records; a stage regresses when it is slower (or takes more memory) beyond the tolerance
+def compare(baseline, current, tolerance = 0.25, min_seconds = 0.5, min_mb = 50):
+    baseline = load_stages(baseline) if isinstance(baseline, str) else baseline
+    current = load_stages(current) if isinstance(current, str) else current
+    table = pd.DataFrame({'baseline_seconds': baseline['wall_seconds'], 'current_seconds': current['wall_seconds'],
+                          'baseline_peak_mb': baseline['peak_rss_delta_mb'], 'current_peak_mb': current['peak_rss_delta_mb']})
+    table = table.loc[[stage for stage in current.index if stage in table.index] +
+                      [stage for stage in baseline.index if stage not in current.index]]
+    table['time_ratio'] = table['current_seconds']/table['baseline_seconds']
+    # Differences below min_seconds or min_mb are noise, not regressions
+    slower = (table['current_seconds'] - table['baseline_seconds'] > min_seconds) & (table['time_ratio'] > 1 + tolerance)
+    heavier = ((table['current_peak_mb'] - table['baseline_peak_mb'] > min_mb) &
+               (table['current_peak_mb'] > (1 + tolerance)*table['baseline_peak_mb']))
+    table['regression'] = slower | heavier
+    return table
+
+
+# Function to run the pipeline stage by stage on a dataset, with small training budgets
+def run_pipeline(data_path, recorder, epochs = 2, tune_epochs = 2, explain_rows = 1000, seed = 0, cache_dir = None):
+    import keras_tuner as kt
+    import tensorflow as tf
+    from sklearn.model_selection import train_test_split
+    from .cache import CACHE_DIR, load_clean_dataset
+    from .dataset_profile import DatasetProfile
+    from .encoding import CategoricalEncoder
+    from .evaluation import evaluation_report
+    from .explain import DeepLiftExplainer
+    from .imputation import ProportionImputer
+    from .ingestion import column_groups
+    from .input_pipeline import fit_datasets, make_dataset
+    from .models import build_baseline, make_model_builder
+    from .numpy_model import NumpyMLP
+    from .scaling import MinMaxScaler
+    from .training import train_best_epoch
+
+    tf.keras.utils.set_random_seed(seed)
+    with recorder.stage('load') as record:
+        data = load_clean_dataset(data_path, cache_dir = cache_dir or CACHE_DIR)
+        record['rows'] = len(data)
+    with recorder.stage('profile', rows = len(data)):
+        profile = DatasetProfile.from_frame(data)
+        profile.missing_proportion()
+        profile.almost_constant(0.9)
+    with recorder.stage('split', rows = len(data)):
+        X, y = data.drop('hospital_death', axis = 1), data['hospital_death'].to_numpy(dtype = np.float32)
+        cols_object = column_groups(X)[2]
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size = 0.2, shuffle = True, random_state = seed)
+    with recorder.stage('impute', rows = len(X)):
+        missing = X_train.isna().mean()
+        kept = missing[missing <= 0.5].index
+        imputer = ProportionImputer(random_state = seed).fit(X_train[kept])
+        X_train, X_test = imputer.transform(X_train[kept]), imputer.transform(X_test[kept])
+    with recorder.stage('encode', rows = len(X)):
+        encoder = CategoricalEncoder(drop_first = True).fit(X_train, [col for col in cols_object if col in kept])
+        numerical = [col for col in kept if col not in encoder.columns_]
+        X_train = np.hstack([X_train[numerical].to_numpy(dtype = np.float32), encoder.transform(X_train)])
+        X_test = np.hstack([X_test[numerical].to_numpy(dtype = np.float32), encoder.transform(X_test)])
+    with recorder.stage('scale', rows = len(X)):
+        scaler = MinMaxScaler().fit(X_train)
+        X_train, X_test = scaler.transform(X_train), scaler.transform(X_test)
+    with recorder.stage('train', rows = len(X_train)*epochs):
+        train, test = fit_datasets(X_train, y_train, validation_data = (X_test, y_test), batch_size = 64, seed = seed)
+        model = build_baseline(X_train.shape[1])
+        model.fit(train, validation_data = test, epochs = epochs, verbose = 0)
+    with recorder.stage('tune') as record, tempfile.TemporaryDirectory() as directory:
+        train_split, val_split = fit_datasets(X_train, y_train, validation_split = 0.2, seed = seed)
+        tuner = kt.Hyperband(make_model_builder(X_train.shape[1]), objective = 'val_accuracy', max_epochs = tune_epochs,
+                             factor = 3, seed = seed, directory = directory, project_name = 'instrumentation')
+        tuner.search(train_split, validation_data = val_split, epochs = tune_epochs, verbose = 0)
+        model = tuner.hypermodel.build(tuner.get_best_hyperparameters(num_trials = 1)[0])
+        model, _, _ = train_best_epoch(model, train_split, val_split, epochs = tune_epochs, verbose = 0)
+        record['rows'] = len(X_train)*tune_epochs*(len(tuner.oracle.trials) + 1)
+    with recorder.stage('evaluate', rows = len(X_test)):
+        probabilities = model.predict(make_dataset(X_test, batch_size = 8192), verbose = 0)[:, 0]
+        evaluation_report(y_test, probabilities)
+    with recorder.stage('explain', rows = min(explain_rows, len(X_test))):
+        background = X_train[np.random.default_rng(seed).choice(len(X_train), size = min(100, len(X_train)), replace = False)]
+        DeepLiftExplainer(NumpyMLP.from_keras(model), background).shap_values(X_test[:explain_rows])
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Stage-level timing and memory of the pipeline.')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+    run = subparsers.add_parser('run', help = 'run the pipeline and record its stages')
+    run.add_argument('data', nargs = '?', default = 'content/Dataset.csv')
+    run.add_argument('--output', default = 'stages.json')
+    run.add_argument('--profile', default = None, help = 'also write the cProfile statistics to this file')
+    run.add_argument('--epochs', type = int, default = 2)
+    run.add_argument('--tune-epochs', type = int, default = 2)
+    run.add_argument('--explain-rows', type = int, default = 1000)
+    run.add_argument('--seed', type = int, default = 0)
+    run.add_argument('--cache-dir', default = None)
+    comparison = subparsers.add_parser('compare', help = 'report the stages that regressed against a baseline')
+    comparison.add_argument('baseline')
+    comparison.add_argument('current')
+    comparison.add_argument('--tolerance', type = float, default = 0.25, help = 'relative slowdown (or memory increase) allowed')
+    comparison.add_argument('--min-seconds', type = float, default = 0.5)
+    comparison.add_argument('--min-mb', type = float, default = 50)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        recorder = StageRecorder(profile = args.profile is not None)
+        run_pipeline(args.data, recorder, epochs = args.epochs, tune_epochs = args.tune_epochs,
+                     explain_rows = args.explain_rows, seed = args.seed, cache_dir = args.cache_dir)
+        recorder.save(args.output)
+        if args.profile is not None:
+            recorder.dump_profile(args.profile)
+        print(recorder.report().to_string())
+        return 0
+
+    table = compare(args.baseline, args.current, tolerance = args.tolerance, min_seconds = args.min_seconds, min_mb = args.min_mb)
+    print(table.to_string())
+    print(" ")
+    regressed = table.index[table['regression']].tolist()
+    print(pd.Series({"Regressed stages": ", ".join(regressed) if regressed else "none"}).to_string())
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Duplicate-column and duplicate-row detection without transposing the dataset.
+
+Columns are compared through digests of their hashed values, accumulated block by
+block of rows, and only the columns whose digests collide are compared value by value,
+in a second pass. Rows are hashed with ``pd.util.hash_pandas_object`` and only the rows
+whose hash occurs more than once are gathered and compared exactly. Both functions
+accept a dataframe or the path of a CSV file, which is then read in chunks.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from .ingestion import read_dataset
+
+
+# Function to iterate over a dataframe, or over a CSV file, in chunks of rows
+def iter_chunks(source, chunksize = 100000):
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunksize):
+            yield source.iloc[start:start + chunksize]
+    else:
+        yield from read_dataset(source, chunksize = chunksize)
+
+
+# Function to get the values of a column in a canonical form, so that e.g. 1 and 1.0 compare equal
+def _canonical(series):
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype = np.float64, na_value = np.nan) + 0.0 # -0.0 becomes 0.0
+        values[np.isnan(values)] = np.nan
+        return values
+    return series.astype(object).where(series.notna(), None).to_numpy(dtype = object)
+
+
+# Function to find groups of identical columns; returns a list of lists of column names
+def duplicate_columns(source, chunksize = 100000):
+    digests = None
+    for chunk in iter_chunks(source, chunksize):
+        if digests is None:
+            digests = {col: hashlib.blake2b(digest_size = 16) for col in chunk.columns}
+        for col in chunk.columns:
+            values = _canonical(chunk[col])
+            # The kind of the values is part of the digest, so numerical and string columns never collide
+            digests[col].update(values.dtype.kind.encode())
+            digests[col].update(pd.util.hash_array(values).tobytes())
+
+    candidates = {}
+    for col, digest in (digests or {}).items():
+        candidates.setdefault(digest.digest(), []).append(col)
+    candidates = [group for group in candidates.values() if len(group) > 1]
+    if not candidates:
+        return []
+
+    # Exact comparison of the colliding columns against the first column of their group
+    equal = {col: True for group in candidates for col in group[1:]}
+    for chunk in iter_chunks(source, chunksize):
+        for group in candidates:
+            reference = _canonical(chunk[group[0]])
+            for col in group[1:]:
+                if equal[col]:
+                    values = _canonical(chunk[col])
+                    if reference.dtype.kind == 'f':
+                        equal[col] = np.array_equal(reference, values, equal_nan = True)
+                    else:
+                        equal[col] = bool((reference == values).all())
+    groups = []
+    for group in candidates:
+        duplicates = [col for col in group[1:] if equal[col]]
+        if duplicates:
+            groups.append([group[0]] + duplicates)
+    return groups
+
+
+# Function to count the rows that duplicate an earlier row, as DataFrame.duplicated().sum() does
+def duplicate_rows(source, chunksize = 100000):
+    hashes = np.concatenate([pd.util.hash_pandas_object(chunk, index = False).to_numpy()
+                             for chunk in iter_chunks(source, chunksize)] or [np.array([], dtype = np.uint64)])
+    values, counts = np.unique(hashes, return_counts = True)
+    repeated = values[counts > 1]
+    if len(repeated) == 0:
+        return 0
+
+    # Exact check of the few rows whose hash occurs more than once
+    rows, offset = [], 0
+    for chunk in iter_chunks(source, chunksize):
+        rows.append(chunk[np.isin(hashes[offset:offset + len(chunk)], repeated)])
+        offset += len(chunk)
+    return int(pd.concat(rows).duplicated().sum())
@@ -0,0 +1,46 @@
+"""Dense networks of the notebook.
+
+``build_baseline`` is the baseline network of section 4 and ``make_model_builder``
+returns the hypermodel of section 5 for a given number of features, so that the
+tuning, training and cross-validation entry points share one definition.
+"""
+
+from tensorflow import keras
+from keras.models import Sequential
+from keras.layers import Dense
+
+
+# Baseline neural network
+def build_baseline(input_dim):
+    model = Sequential()
+    model.add(Dense(16, input_dim = input_dim, activation = 'relu'))
+    model.add(Dense(12, activation = 'relu'))
+    model.add(Dense(8, activation = 'relu'))
+    model.add(Dense(4, activation = 'relu'))
+    model.add(Dense(1, activation = 'sigmoid'))
+    model.compile(loss = 'binary_crossentropy', optimizer = 'adam', metrics = ['accuracy'])
+    return model
+
+
+# Function to make the hypermodel builder for a given number of features
+def make_model_builder(input_dim):
+    def model_builder(ht):
+        model = Sequential()
+        model.add(keras.layers.Flatten(input_shape = (input_dim,)))
+
+        # Tuning the number of units in the first Dense layer
+        ht_units = ht.Int('units', min_value = 32, max_value = 512, step = 32) # 32-512
+        model.add(keras.layers.Dense(units = ht_units, activation = 'relu'))
+        model.add(keras.layers.Dense(12, activation = 'relu'))
+        model.add(keras.layers.Dense(8, activation = 'relu'))
+        model.add(keras.layers.Dense(4, activation = 'relu'))
+        model.add(keras.layers.Dense(1, activation = 'sigmoid'))
+
+        # Tuning the learning rate for the optimizer
+        ht_learning_rate = ht.Choice('learning_rate', values = [0.01, 0.001, 0.0001])
+
+        model.compile(loss = 'binary_crossentropy', optimizer = keras.optimizers.Adam(learning_rate = ht_learning_rate),
+                      metrics = ['accuracy'])
+
+        return model
+    return model_builder
@@ -0,0 +1,119 @@
+"""Pure-NumPy inference for the Dense network.
+
+The tuned model is a plain stack of Dense layers (the tuned first layer, then
+12 -> 8 -> 4 -> 1 sigmoid), so scoring it is a handful of float32 matrix products.
+The weights are exported once from ``model_tuned.h5`` to a compact ``.npz`` file, and
+scoring processes then run the forward pass without importing TensorFlow.
+
+    python -m src.numpy_model model_tuned.h5 model_tuned.npz
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ACTIVATIONS = {'linear': lambda x: x,
+               'relu': lambda x: np.maximum(x, 0, out = x),
+               'sigmoid': lambda x: np.divide(1, 1 + np.exp(-x, out = x), out = x),
+               'tanh': lambda x: np.tanh(x, out = x)}
+
+# Largest absolute difference with the Keras predictions tolerated when the weights are exported
+EXPORT_ATOL = 1e-5
+
+
+class NumpyMLP:
+
+    def __init__(self, kernels, biases, activations):
+        self.kernels = [np.ascontiguousarray(W, dtype = np.float32) for W in kernels]
+        self.biases = [np.asarray(b, dtype = np.float32) for b in biases]
+        self.activations = list(activations)
+
+    # Forward pass; a single encounter can be given without the batch dimension
+    def predict(self, X, batch_size = None, verbose = 0):
+        X = np.asarray(X, dtype = np.float32)
+        single = X.ndim == 1
+        X = X[None, :] if single else X
+        batch_size = len(X) if not batch_size else batch_size
+        out = np.empty((len(X), self.kernels[-1].shape[1]), dtype = np.float32)
+        with np.errstate(over = 'ignore'): # exp overflows to inf for very negative logits, giving a sigmoid of 0
+            for start in range(0, len(X), batch_size):
+                h = X[start:start + batch_size]
+                for W, b, activation in zip(self.kernels, self.biases, self.activations):
+                    h = h @ W
+                    h += b
+                    h = ACTIVATIONS[activation](h)
+                out[start:start + batch_size] = h
+        return out[0] if single else out
+
+    __call__ = predict
+
+    @property
+    def input_dim(self):
+        return self.kernels[0].shape[0]
+
+    def save(self, path):
+        arrays = {}
+        for i, (W, b) in enumerate(zip(self.kernels, self.biases)):
+            arrays[f'kernel_{i}'] = W
+            arrays[f'bias_{i}'] = b
+        np.savez(path, activations = np.array(self.activations), **arrays)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as f:
+            n_layers = len([key for key in f.files if key.startswith('kernel_')])
+            return NumpyMLP([f[f'kernel_{i}'] for i in range(n_layers)],
+                            [f[f'bias_{i}'] for i in range(n_layers)],
+                            f['activations'].tolist())
+
+    # Function to extract the Dense layers of a Keras Sequential model (Flatten layers are no-ops here)
+    @staticmethod
+    def from_keras(model):
+        kernels, biases, activations = [], [], []
+        for layer in model.layers:
+            if layer.__class__.__name__ == 'Flatten':
+                continue
+            if layer.__class__.__name__ != 'Dense':
+                raise ValueError(f"Layer '{layer.name}' of type {layer.__class__.__name__} is not supported")
+            activation = layer.get_config()['activation']
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Activation '{activation}' of layer '{layer.name}' is not supported")
+            kernel, bias = layer.get_weights()
+            kernels.append(kernel)
+            biases.append(bias)
+            activations.append(activation)
+        return NumpyMLP(kernels, biases, activations)
+
+
+# Function to compare the NumPy forward pass with Keras on random min-max scaled inputs
+def max_abs_difference(keras_model, numpy_model, rows = 4096, seed = 0):
+    X = np.random.default_rng(seed).random((rows, numpy_model.input_dim), dtype = np.float32)
+    return float(np.abs(keras_model.predict(X, batch_size = rows, verbose = 0) - numpy_model.predict(X)).max())
+
+
+# Function to export the weights of a saved Keras model, checking the exported forward pass against Keras
+def export_weights(h5_path, npz_path, atol = EXPORT_ATOL):
+    from keras.models import load_model
+    keras_model = load_model(h5_path, compile = False)
+    numpy_model = NumpyMLP.from_keras(keras_model)
+    difference = max_abs_difference(keras_model, numpy_model)
+    if difference > atol:
+        raise ValueError(f"NumPy and Keras predictions differ by up to {difference:.2e} (tolerance {atol:.0e})")
+    numpy_model.save(npz_path)
+    return difference
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Export the weights of the tuned model for NumPy inference.')
+    parser.add_argument('model', nargs = '?', default = 'model_tuned.h5')
+    parser.add_argument('output', nargs = '?', default = 'model_tuned.npz')
+    parser.add_argument('--atol', type = float, default = EXPORT_ATOL)
+    args = parser.parse_args()
+    difference = export_weights(args.model, args.output, atol = args.atol)
+    print(pd.Series({"Exported weights": args.output,
+                     "Maximum absolute difference with Keras": "{:.2e}".format(difference)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Fit-once preprocessing pipeline: drop -> impute -> encode -> scale.
+
+The pipeline learns everything it needs from the training set only (columns with a
+majority of missing values, the proportion-based imputation distributions, the
+category vocabularies and the min-max scaling constants), either at once or chunk by
+chunk, can be saved to disk, and turns any later batch of encounters into a float32
+feature matrix with one call.
+"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .encoding import CategoricalEncoder
+from .imputation import ProportionImputer
+from .scaling import MinMaxScaler
+
+
+class PreprocessingPipeline:
+
+    def __init__(self, cols_object, missing_threshold = 0.5, drop_first = True, random_state = None):
+        self.cols_object = list(cols_object)
+        self.missing_threshold = missing_threshold
+        self.drop_first = drop_first
+        self.random_state = random_state
+
+    # Learning the preprocessing constants from the training predictors
+    def fit(self, X):
+        return self.fit_chunks([X])
+
+    # Learning the preprocessing constants from an iterable of chunks of the training predictors
+    def fit_chunks(self, chunks):
+        imputer = ProportionImputer(random_state = self.random_state)
+        scaler = MinMaxScaler()
+        missing, n = None, 0
+        for chunk in chunks:
+            if missing is None:
+                columns = chunk.columns.tolist()
+                numerical = [col for col in columns if col not in self.cols_object]
+            missing = chunk.isna().sum() if missing is None else missing + chunk.isna().sum()
+            n += len(chunk)
+            imputer.partial_fit(chunk)
+            # Min-max constants; imputation only draws observed values, so they are those of the observed data
+            scaler.partial_fit(chunk[numerical])
+        if n == 0:
+            raise ValueError("No rows to fit the preprocessing pipeline on: chunks is empty")
+
+        missing = missing/n
+        self.dropped_ = missing[missing > self.missing_threshold].index.tolist()
+        kept = [col for col in columns if col not in self.dropped_]
+        self.categorical_ = [col for col in kept if col in self.cols_object]
+        self.numerical_ = [col for col in kept if col not in self.categorical_]
+        self.imputer_ = imputer
+        self.scaler_ = scaler.subset([numerical.index(col) for col in self.numerical_])
+
+        # Category vocabularies (the observed training values), with a bucket for categories unseen in training
+        self.encoder_ = CategoricalEncoder(drop_first = self.drop_first).set_vocabularies(
+            {col: self.imputer_.values_[col] for col in self.categorical_})
+        self.vocabularies_ = self.encoder_.vocabularies_
+
+        self.feature_names_ = self.numerical_ + self.encoder_.feature_names_
+        return self
+
+    # Applying the fitted preprocessing to a batch of predictors
+    def transform(self, X, as_frame = False):
+        n, p = len(X), len(self.numerical_)
+        out = np.zeros((n, len(self.feature_names_)), dtype = np.float32)
+
+        # Numerical block: impute the missing cells, then min-max scale with the training constants
+        out[:, :p] = X[self.numerical_].to_numpy(dtype = np.float32, na_value = np.nan)
+        self.imputer_.transform_array(out[:, :p], self.numerical_)
+        self.scaler_.transform(out[:, :p])
+
+        # Categorical block: impute, then one-hot encode against the training vocabularies, in place
+        categorical = self.imputer_.transform_array(X[self.categorical_].to_numpy(dtype = object, copy = True),
+                                                    self.categorical_)
+        self.encoder_.transform(pd.DataFrame(categorical, columns = self.categorical_), out = out, offset = p)
+
+        if as_frame:
+            return pd.DataFrame(out, index = X.index, columns = self.feature_names_)
+        return out
+
+    def fit_transform(self, X, as_frame = False):
+        return self.fit(X).transform(X, as_frame = as_frame)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
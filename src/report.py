@@ -0,0 +1,240 @@
+"""Headless EDA report: the figures of section 2 rendered to files in a process pool.
+
+The statistics behind every figure (value counts, histogram and KDE curves,
+contingency tables, the correlation matrix) are computed in the main process with the
+vectorized engines of this package. Each figure is keyed by a hash of its own
+statistics, and the key is recorded in ``manifest.json`` in the output directory;
+figures whose key is unchanged since the last run are not rendered again. Only the
+remaining ones are sent to a pool of worker processes, which draw them with the Agg
+backend. An ``index.html`` links the figures by section.
+
+    python -m src.report content/Dataset.csv --output-dir report
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .cache import CACHE_DIR, load_clean_dataset
+from .contingency import contingency_tables
+from .correlation import correlation_matrix
+from .dataset_profile import DatasetProfile
+from .density import DensitySummary, Summary
+
+REPORT_VERSION = 1 # Part of every figure key: bump it when the drawing code changes
+
+SECTIONS = [('target', "Target variable"), ('frequency', "Frequency distributions"),
+            ('distribution', "Distributions of float features"), ('contingency', "Target x categorical features"),
+            ('density', "Target x float features"), ('correlation', "Correlation structure")]
+
+
+# Function to hash the statistics of a figure (arrays, pandas objects, tuples and plain values)
+def _digest(*parts):
+    digest = hashlib.blake2b(str(REPORT_VERSION).encode(), digest_size = 16)
+    for part in parts:
+        if isinstance(part, (pd.Series, pd.DataFrame)):
+            digest.update(repr(part.index.tolist()).encode())
+            if isinstance(part, pd.DataFrame):
+                digest.update(repr(part.columns.tolist()).encode())
+            part = part.to_numpy()
+        if isinstance(part, np.ndarray):
+            digest.update(str((part.dtype, part.shape)).encode())
+            digest.update(np.ascontiguousarray(part).tobytes() if part.dtype != object else repr(part.tolist()).encode())
+        elif isinstance(part, tuple):
+            digest.update(_digest(*part).encode())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _save(fig, path):
+    import matplotlib.pyplot as plt
+    fig.tight_layout()
+    fig.savefig(path, dpi = 100)
+    plt.close(fig)
+
+
+def _draw_bar_donut(path, col, counts):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(1, 2, figsize = (10, 4))
+    labels = [str(label) for label in counts.index]
+    bars = ax[0].bar(labels, counts.to_numpy())
+    ax[0].bar_label(bars)
+    ax[0].set_xlabel(col)
+    ax[1].pie(counts.to_numpy(), labels = labels, autopct = '%1.1f%%', wedgeprops = {'width': 0.5})
+    fig.suptitle(f"Frequency distribution of {col}")
+    _save(fig, path)
+
+
+def _draw_donut(path, col, counts):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize = (4, 4))
+    ax.pie(counts.to_numpy(), labels = [str(label) for label in counts.index], autopct = '%1.1f%%',
+           wedgeprops = {'width': 0.5})
+    ax.set_title(col)
+    _save(fig, path)
+
+
+def _draw_countplot(path, col, counts):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize = (6, 4.5))
+    ax.bar([str(label) for label in counts.index], counts.to_numpy())
+    ax.set_xlabel(col)
+    ax.set_ylabel("count")
+    ax.tick_params(axis = 'x', rotation = 90 if len(counts) > 5 else 0)
+    _save(fig, path)
+
+
+def _draw_distribution(path, col, summary, hue, hue_levels, kind):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize = (4, 0.84*4))
+    densities = DensitySummary({col: summary}, hue, hue_levels)
+    if kind == 'hist':
+        densities.draw_histogram(ax, col)
+    else:
+        densities.draw_kde(ax, col)
+    _save(fig, path)
+
+
+def _draw_contingency(path, col, target, table):
+    import matplotlib.pyplot as plt
+    counts = table.counts
+    fig, ax = plt.subplots(figsize = (max(4, 1.6*counts.shape[1]), max(3, 1.3*counts.shape[0])))
+    image = ax.imshow(counts, cmap = 'magma', aspect = 'auto')
+    for i in range(counts.shape[0]):
+        for j in range(counts.shape[1]):
+            ax.text(j, i, str(counts[i, j]), ha = 'center', va = 'center', fontsize = 12,
+                    color = 'black' if counts[i, j] > counts.max()/2 else 'white')
+    ax.set_xticks(range(counts.shape[1]), [str(value) for value in table.feature_classes],
+                  rotation = 45 if counts.shape[1] > 3 else 0, ha = 'right')
+    ax.set_yticks(range(counts.shape[0]), [str(value) for value in table.target_classes])
+    ax.set_xlabel(col)
+    ax.set_ylabel(target)
+    fig.colorbar(image, ax = ax)
+    _save(fig, path)
+
+
+def _draw_correlation(path, corr, threshold):
+    from .correlation_report import correlation_report
+    correlation_report(corr, threshold = threshold, output_dir = os.path.splitext(path)[0])
+    os.replace(os.path.join(os.path.splitext(path)[0], 'overview.png'), path)
+
+
+DRAW = {'bar_donut': _draw_bar_donut, 'donut': _draw_donut, 'countplot': _draw_countplot,
+        'distribution': _draw_distribution, 'contingency': _draw_contingency, 'correlation': _draw_correlation}
+
+
+def _render(kind, path, args):
+    DRAW[kind](path, *args)
+    return path
+
+
+# Function to list the figures of the report: (section, name, kind, drawing arguments), with the statistics they show
+def figure_specs(data, target = 'hospital_death', corr_threshold = 0.9):
+    profile = DatasetProfile.from_frame(data)
+    specs = [('target', target, 'bar_donut', (target, data[target].value_counts(sort = False)))]
+
+    cols_binary = [col for col in profile.binary() if col != target]
+    for col in cols_binary + profile.select(min_unique = 3, max_unique = 15):
+        kind = 'donut' if col in cols_binary else 'countplot'
+        specs.append(('frequency', col, kind, (col, data[col].value_counts(sort = False))))
+
+    cols_float = profile.select(min_unique = 16, kind = 'float')
+    densities = DensitySummary.from_frame(data, cols_float, hue = target)
+    for col in cols_float:
+        summary = densities.summaries[col]
+        pooled = Summary(summary.edges, summary.counts.sum(axis = 0, keepdims = True), None, None)
+        specs.append(('distribution', col, 'distribution', (col, pooled, None, [None], 'hist')))
+        specs.append(('density', col, 'distribution', (col, summary, target, densities.hue_levels, 'kde')))
+
+    tables = contingency_tables(data, target, cols_binary + profile.select(min_unique = 3, max_unique = 15))
+    for col, table in tables.items():
+        specs.append(('contingency', col, 'contingency', (col, target, table)))
+
+    cols_numeric = [col for col in profile.select(exclude_kind = 'categorical') if col != target]
+    corr = correlation_matrix(data, cols_numeric).round(4) # Rounded, so that noise does not invalidate the key
+    specs.append(('correlation', 'correlation', 'correlation', (corr, corr_threshold)))
+    return specs
+
+
+# Function to write the index page of the report
+def _write_index(output_dir, entries):
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>EDA report</title></head><body>',
+             '<h1>Exploratory data analysis</h1>']
+    for section, title in SECTIONS:
+        files = [entry['file'] for entry in entries.values() if entry['section'] == section]
+        if files:
+            lines.append(f'<h2>{html.escape(title)}</h2>')
+            lines.extend(f'<a href="{html.escape(file)}"><img src="{html.escape(file)}" height="300"></a>' for file in files)
+    lines.append('</body></html>')
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write('\n'.join(lines))
+
+
+# Function to render the report; figures whose statistics are unchanged since the last run are skipped
+def build_report(data, output_dir, target = 'hospital_death', max_workers = None, corr_threshold = 0.9):
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok = True)
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    specs = figure_specs(data, target = target, corr_threshold = corr_threshold)
+    statistics_time = time.perf_counter() - start
+    entries, jobs = {}, []
+    for section, name, kind, args in specs:
+        figure_id = f'{section}/{name}'
+        file = f'{section}-{name}.png'.replace(os.sep, '_')
+        key = _digest(kind, *args)
+        entries[figure_id] = {'section': section, 'file': file, 'key': key}
+        cached = manifest.get(figure_id)
+        if cached is None or cached['key'] != key or not os.path.exists(os.path.join(output_dir, file)):
+            jobs.append((kind, os.path.join(output_dir, file), args))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers = max_workers, mp_context = mp.get_context('spawn'),
+                                 initializer = _init_worker) as executor:
+            list(executor.map(_render, *zip(*jobs)))
+    with open(manifest_path, 'w') as f:
+        json.dump(entries, f, indent = 2)
+    _write_index(output_dir, entries)
+    return pd.Series({"Figures in the report": len(entries),
+                      "Figures rendered": len(jobs),
+                      "Figures unchanged (skipped)": len(entries) - len(jobs),
+                      "Statistics": "{:.2f} seconds".format(statistics_time),
+                      "Process runtime": "{:.2f} seconds".format(time.perf_counter() - start)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Render the EDA figures to a static report.')
+    parser.add_argument('data', nargs = '?', default = 'content/Dataset.csv')
+    parser.add_argument('--output-dir', default = 'report')
+    parser.add_argument('--target', default = 'hospital_death')
+    parser.add_argument('--workers', type = int, default = None, help = 'defaults to one per core')
+    parser.add_argument('--corr-threshold', type = float, default = 0.9, help = 'correlations annotated in the tiles')
+    parser.add_argument('--cache-dir', default = CACHE_DIR)
+    args = parser.parse_args()
+
+    data = load_clean_dataset(args.data, cache_dir = args.cache_dir)
+    report = build_report(data, args.output_dir, target = args.target, max_workers = args.workers,
+                          corr_threshold = args.corr_threshold)
+    print(report.to_string())
+
+
+if __name__ == '__main__':
+    main()
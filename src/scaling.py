@@ -0,0 +1,66 @@
+"""Min-max normalization of a float32 feature matrix.
+
+The minimum and maximum of every column are reduced together, block of rows by block
+of rows, over a contiguous float32 matrix. Constant columns are masked out by giving
+them a neutral offset and scale, so the transform is two in-place ufunc calls over the
+whole matrix. The training constants are kept to scale test and production data.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class MinMaxScaler:
+
+    def __init__(self, block_rows = 65536):
+        self.block_rows = block_rows
+
+    # Learning the minimum and the maximum of every column, ignoring missing values
+    def fit(self, X):
+        self.__dict__.pop('min_', None)
+        self.__dict__.pop('max_', None)
+        return self.partial_fit(X)
+
+    # Updating the minimum and the maximum with a further batch of rows
+    def partial_fit(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = X.to_numpy(dtype = np.float32, na_value = np.nan)
+        X = np.ascontiguousarray(X, dtype = np.float32)
+        if not hasattr(self, 'min_'):
+            self.min_ = np.full(X.shape[1], np.nan, dtype = np.float32)
+            self.max_ = np.full(X.shape[1], np.nan, dtype = np.float32)
+        for start in range(0, len(X), self.block_rows):
+            block = X[start:start + self.block_rows]
+            np.fmin(self.min_, np.fmin.reduce(block, axis = 0), out = self.min_)
+            np.fmax(self.max_, np.fmax.reduce(block, axis = 0), out = self.max_)
+        self._set_constants()
+        return self
+
+    # Constant (or entirely missing) columns are left unchanged
+    def _set_constants(self):
+        self.constant_ = ~(self.max_ > self.min_)
+        self.offset_ = np.where(self.constant_, 0, self.min_).astype(np.float32)
+        self.scale_ = np.ones_like(self.min_)
+        np.divide(1, self.max_ - self.min_, out = self.scale_, where = ~self.constant_)
+
+    # Restricting the fitted scaler to a subset of its columns
+    def subset(self, columns):
+        scaler = MinMaxScaler(block_rows = self.block_rows)
+        scaler.min_ = self.min_[columns]
+        scaler.max_ = self.max_[columns]
+        scaler._set_constants()
+        return scaler
+
+    # Scaling with the training constants; float32 arrays are scaled in place
+    def transform(self, X, copy = False):
+        if isinstance(X, pd.DataFrame):
+            values = self.transform(X.to_numpy(dtype = np.float32, na_value = np.nan, copy = True))
+            return pd.DataFrame(values, index = X.index, columns = X.columns)
+        if copy or X.dtype != np.float32:
+            X = np.array(X, dtype = np.float32)
+        np.subtract(X, self.offset_, out = X)
+        np.multiply(X, self.scale_, out = X)
+        return X
+
+    def fit_transform(self, X, copy = False):
+        return self.fit(X).transform(X, copy = copy)
@@ -0,0 +1,116 @@
+"""Batch scoring of new encounters with the tuned model.
+
+The model and the fitted preprocessing pipeline are loaded once; the input file (CSV or
+Parquet) is then streamed in batches through ``PreprocessingPipeline.transform`` and
+``predict``, and the probabilities and thresholded ``hospital_death`` predictions are
+appended to the output file (CSV or Parquet, by extension). A model exported with
+``python -m src.numpy_model`` (``.npz``) is scored without importing TensorFlow.
+
+    python -m src.scoring encounters.csv scores.csv --model model_tuned.npz --preprocessor preprocessor.pkl
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .ingestion import read_dataset
+from .instrumentation import _PeakSampler
+from .numpy_model import NumpyMLP
+from .preprocessing import PreprocessingPipeline
+
+
+# Function to stream a CSV or Parquet file as dataframes of at most batch_size rows
+def iter_batches(path, batch_size):
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = batch_size):
+            yield batch.to_pandas()
+    else:
+        yield from read_dataset(path, chunksize = batch_size)
+
+
+class _ScoreWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self.writer = None
+
+    def write(self, df):
+        if self.parquet:
+            table = pa.Table.from_pandas(df, preserve_index = False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode = 'w' if self.writer is None else 'a', header = self.writer is None, index = False)
+            self.writer = True
+
+    def close(self):
+        if self.parquet and self.writer is not None:
+            self.writer.close()
+
+
+# Function to load the saved model: exported NumPy weights (.npz) or Keras (TensorFlow is only imported then)
+def load_scoring_model(path):
+    if path.endswith('.npz'):
+        return NumpyMLP.load(path)
+    from keras.models import load_model
+    return load_model(path, compile = False)
+
+
+# Function to score a file in batches; returns the throughput and memory metrics
+def score_file(input_path, output_path, model, preprocessor, batch_size = 65536, predict_batch_size = 8192,
+               threshold = 0.5, id_column = 'encounter_id'):
+    # Peak resident memory sampled in the background, so that the peaks inside transform and predict are caught
+    sampler = _PeakSampler(psutil.Process(os.getpid()), interval = 0.01)
+    sampler.start()
+    writer = _ScoreWriter(output_path)
+    rows = 0
+    start = time.perf_counter()
+    try:
+        for batch in iter_batches(input_path, batch_size):
+            probabilities = model.predict(preprocessor.transform(batch), batch_size = predict_batch_size, verbose = 0)[:, 0]
+            scores = pd.DataFrame({'hospital_death_probability': probabilities,
+                                   'hospital_death': (probabilities >= threshold).astype(np.int8)})
+            if id_column in batch.columns:
+                scores.insert(0, id_column, batch[id_column].to_numpy())
+            writer.write(scores)
+            rows += len(batch)
+    finally:
+        writer.close()
+        peak_rss = sampler.stop()
+    runtime = time.perf_counter() - start
+    return pd.Series({"Rows scored": rows,
+                      "Process runtime": "{:.2f} seconds".format(runtime),
+                      "Throughput": "{:.0f} rows/sec".format(rows/runtime if runtime > 0 else float('nan')),
+                      "Peak process memory usage": "{:.2f} MB".format(peak_rss/(1024*1024))})
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Score new encounters with the tuned model.')
+    parser.add_argument('input', help = 'CSV or Parquet file of encounters')
+    parser.add_argument('output', help = 'CSV or Parquet file to write the scores to')
+    parser.add_argument('--model', default = 'model_tuned.h5', help = 'Keras .h5 model or exported .npz weights')
+    parser.add_argument('--preprocessor', default = 'preprocessor.pkl')
+    parser.add_argument('--batch-size', type = int, default = 65536, help = 'rows read and transformed at a time')
+    parser.add_argument('--predict-batch-size', type = int, default = 8192)
+    parser.add_argument('--threshold', type = float, default = 0.5)
+    parser.add_argument('--id-column', default = 'encounter_id')
+    args = parser.parse_args()
+
+    model = load_scoring_model(args.model)
+    preprocessor = PreprocessingPipeline.load(args.preprocessor)
+    report = score_file(args.input, args.output, model, preprocessor, batch_size = args.batch_size,
+                        predict_batch_size = args.predict_batch_size, threshold = args.threshold,
+                        id_column = args.id_column)
+    print(report.to_string())
+
+
+if __name__ == '__main__':
+    main()
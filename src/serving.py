@@ -0,0 +1,221 @@
+"""Online inference server with micro-batching.
+
+Single-encounter requests are put on an asyncio queue; a batching task takes whatever
+has arrived within ``max_wait_ms`` of the first waiting request (up to
+``max_batch_size`` rows), runs the preprocessing pipeline and the model once for the
+whole micro-batch in a worker thread, and resolves every request with its own row.
+Records are validated before they are queued, so a malformed record is rejected with
+400 to its sender only; should a micro-batch still fail, its rows are scored one by
+one, so only the offending request fails.
+
+The server speaks a minimal HTTP/1.1 over TCP or a Unix socket:
+
+    POST /predict    body: one JSON object of feature values (or a list of them)
+    GET  /health
+
+    python -m src.serving --model model_tuned.npz --preprocessor preprocessor.pkl --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+
+from .preprocessing import PreprocessingPipeline
+from .scoring import load_scoring_model
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+class MicroBatcher:
+
+    def __init__(self, model, preprocessor, max_batch_size = 256, max_wait_ms = 2.0, threshold = 0.5):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms/1000
+        self.threshold = threshold
+        self.queue = asyncio.Queue()
+        self.batch_sizes = []
+
+    # Function to check a record and coerce it to the columns of the pipeline: numbers for the numerical columns,
+    # strings for the categorical ones, None for the missing ones; other keys are ignored
+    def validate(self, record):
+        if not isinstance(record, dict):
+            raise InvalidRecord(f"A record must be a JSON object, not {type(record).__name__}")
+        clean = {}
+        for col in self.preprocessor.numerical_:
+            value = record.get(col)
+            if value is None:
+                clean[col] = np.nan
+            elif isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise InvalidRecord(f"'{col}' must be a number, not {type(value).__name__}")
+            else:
+                try:
+                    clean[col] = float(value)
+                except ValueError:
+                    raise InvalidRecord(f"'{col}' must be a number, not '{value}'") from None
+        for col in self.preprocessor.categorical_:
+            value = record.get(col)
+            if value is not None and not isinstance(value, (str, int, float)):
+                raise InvalidRecord(f"'{col}' must be a string, not {type(value).__name__}")
+            clean[col] = None if value is None else str(value)
+        return clean
+
+    # Function to score one encounter; resolves once its micro-batch has been predicted
+    async def predict(self, record):
+        record = self.validate(record)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future))
+        return await future
+
+    # Function to predict a micro-batch of validated records (run in a worker thread)
+    def _predict_batch(self, records):
+        # Validated records have a float (or NaN) in every numerical column, so those columns are parsed as float64
+        X = pd.DataFrame.from_records(records, columns = self.preprocessor.numerical_ + self.preprocessor.categorical_)
+        X = self.preprocessor.transform(X)
+        return np.asarray(self.model.predict(X, batch_size = len(X), verbose = 0))[:, 0]
+
+    # Function to resolve a future with the prediction of its record
+    def _resolve(self, future, probability):
+        if not future.done():
+            future.set_result({'hospital_death_probability': float(probability),
+                               'hospital_death': int(probability >= self.threshold)})
+
+    # Batching loop: waits for a first request, then collects more until the batch is full or the wait is over
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+            try:
+                probabilities = await loop.run_in_executor(None, self._predict_batch, [record for record, _ in batch])
+            except Exception:
+                # Scoring the rows one by one, so that only the request of a failing row fails
+                for record, future in batch:
+                    try:
+                        probability = (await loop.run_in_executor(None, self._predict_batch, [record]))[0]
+                    except Exception as error:
+                        if not future.done():
+                            future.set_exception(error)
+                    else:
+                        self._resolve(future, probability)
+                continue
+            for (_, future), probability in zip(batch, probabilities):
+                self._resolve(future, probability)
+
+
+# Function to send an HTTP response with a JSON body
+async def _respond(writer, status, body):
+    payload = json.dumps(body).encode()
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+    writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload)
+    await writer.drain()
+
+
+# Connection handler; connections are kept alive so a client can send many requests over one socket
+def make_handler(batcher):
+    async def handle(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode().split(' ', 2)
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        key, value = line.decode().split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    # The rest of the stream cannot be framed, so the connection is closed after the response
+                    await _respond(writer, 400, {'error': 'Malformed request'})
+                    break
+                body = await reader.readexactly(length)
+
+                if method == 'GET' and target == '/health':
+                    await _respond(writer, 200, {'status': 'ok'})
+                elif method == 'POST' and target == '/predict':
+                    try:
+                        records = json.loads(body)
+                    except ValueError as error:
+                        await _respond(writer, 400, {'error': str(error)})
+                        continue
+                    try:
+                        if isinstance(records, list):
+                            for record in records: # All the records are checked before any is queued
+                                batcher.validate(record)
+                            result = list(await asyncio.gather(*[batcher.predict(record) for record in records]))
+                        else:
+                            result = await batcher.predict(records)
+                    except InvalidRecord as error:
+                        await _respond(writer, 400, {'error': str(error)})
+                        continue
+                    except Exception as error:
+                        await _respond(writer, 500, {'error': str(error)})
+                        continue
+                    await _respond(writer, 200, result)
+                else:
+                    await _respond(writer, 404, {'error': f'{method} {target} is not served'})
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+# Function to start the server; returns the asyncio server and the batching task
+async def start_server(batcher, host = '127.0.0.1', port = 8080, unix_socket = None):
+    batching_task = asyncio.create_task(batcher.run())
+    if unix_socket is not None:
+        server = await asyncio.start_unix_server(make_handler(batcher), path = unix_socket)
+    else:
+        server = await asyncio.start_server(make_handler(batcher), host = host, port = port)
+    return server, batching_task
+
+
+async def _serve(args):
+    model = load_scoring_model(args.model)
+    preprocessor = PreprocessingPipeline.load(args.preprocessor)
+    batcher = MicroBatcher(model, preprocessor, max_batch_size = args.max_batch_size,
+                           max_wait_ms = args.max_wait_ms, threshold = args.threshold)
+    server, _ = await start_server(batcher, host = args.host, port = args.port, unix_socket = args.unix_socket)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Serve mortality risk scores for single encounters.')
+    parser.add_argument('--model', default = 'model_tuned.h5', help = 'Keras .h5 model or exported .npz weights')
+    parser.add_argument('--preprocessor', default = 'preprocessor.pkl')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--unix-socket', default = None, help = 'serve on a Unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type = int, default = 256)
+    parser.add_argument('--max-wait-ms', type = float, default = 2.0)
+    parser.add_argument('--threshold', type = float, default = 0.5)
+    asyncio.run(_serve(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""Synthetic GOSSIS-shaped datasets generated from the data dictionary.
+
+Every variable of ``Data Dictionary.csv`` (except the example prediction ``pred``) is
+generated according to its category, data type and measurement:
+- vitals and labs are drawn around typical ICU values, on the scales of the real dataset
+- ``_min`` and ``_max`` columns bracket a common draw, so a minimum never exceeds its maximum
+- binary flags follow typical prevalences
+- strings follow the vocabularies and frequencies of the real categories
+
+Missing values come at the rates of the real dataset and in blocks: a measurement that
+was not taken is missing in both its ``_min`` and ``_max`` columns. A latent severity
+score moves the vitals, labs, GCS components and APACHE probabilities. ``hospital_death``
+is drawn from the same severity, at a prevalence of about 8.6%.
+
+Datasets of any size are generated chunk by chunk, each chunk from its own seed, and
+can be written to CSV without holding more than one chunk in memory:
+
+    python -m src.synthetic content/Synthetic.csv --rows 1000000 --chunksize 100000
+"""
+
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from .ingestion import load_dictionary, schema_dtypes
+
+TARGET = 'hospital_death'
+
+# Measurements: distribution, centre (median for lognormal), spread (sigma of the log for lognormal),
+# bounds and loading on the latent severity (in units of the spread)
+MEASUREMENTS = {
+    'age': ('normal', 62, 16, 16, 89, 0.3),
+    'height': ('normal', 170, 10.8, 137, 196, 0),
+    'weight': ('normal', 84, 25, 38, 187, 0),
+    'pre_icu_los_days': ('lognormal', 0.15, 1.5, 0, 160, 0.1),
+    'heartrate': ('normal', 90, 18, 30, 180, 0.4),
+    'heart_rate': ('normal', 100, 30, 30, 180, 0.4),
+    'sysbp': ('normal', 125, 22, 50, 230, -0.3),
+    'diasbp': ('normal', 65, 13, 25, 130, -0.3),
+    'mbp': ('normal', 85, 15, 35, 160, -0.3),
+    'map': ('normal', 88, 30, 40, 200, -0.3),
+    'resprate': ('normal', 20, 6, 4, 60, 0.3),
+    'spo2': ('normal', 96, 3, 60, 100, -0.3),
+    'temp': ('normal', 36.7, 0.7, 32, 40, -0.1),
+    'albumin': ('normal', 2.9, 0.6, 1, 5, -0.4),
+    'bilirubin': ('lognormal', 0.8, 0.9, 0.1, 50, 0.3),
+    'bun': ('lognormal', 20, 0.7, 1, 250, 0.4),
+    'calcium': ('normal', 8.3, 0.7, 4, 12, -0.2),
+    'creatinine': ('lognormal', 1.1, 0.6, 0.3, 12, 0.4),
+    'glucose': ('lognormal', 140, 0.4, 40, 600, 0.2),
+    'hco3': ('normal', 24, 4, 6, 45, -0.4),
+    'hemaglobin': ('normal', 11.5, 2.2, 4, 19, -0.2),
+    'hematocrit': ('normal', 34, 6.5, 13, 57, -0.2),
+    'inr': ('lognormal', 1.2, 0.35, 0.8, 9, 0.3),
+    'lactate': ('lognormal', 1.7, 0.6, 0.4, 20, 0.6),
+    'platelets': ('lognormal', 200, 0.45, 10, 700, -0.2),
+    'potassium': ('normal', 4.1, 0.6, 2.5, 7, 0.1),
+    'sodium': ('normal', 138, 4.5, 117, 159, 0),
+    'wbc': ('lognormal', 10, 0.45, 0.9, 46, 0.3),
+    'arterial_pco2': ('normal', 42, 10, 15, 100, 0.1),
+    'arterial_ph': ('normal', 7.36, 0.08, 6.9, 7.65, -0.4),
+    'arterial_po2': ('lognormal', 120, 0.5, 30, 540, 0),
+    'pao2fio2ratio': ('lognormal', 250, 0.5, 50, 820, -0.4),
+    'fio2': ('normal', 0.6, 0.25, 0.21, 1, 0.3),
+    'paco2': ('normal', 42, 10, 15, 100, 0.1),
+    'paco2_for_ph': ('normal', 42, 10, 15, 100, 0.1),
+    'pao2': ('lognormal', 120, 0.5, 30, 500, 0),
+    'ph': ('normal', 7.36, 0.08, 6.9, 7.65, -0.4),
+    'urineoutput': ('lognormal', 1500, 0.7, 0, 9000, -0.3),
+}
+
+# Integer scores: values and their probabilities for a patient of average severity
+SCORES = {'gcs_eyes_apache': ([1, 2, 3, 4], [0.12, 0.06, 0.16, 0.66]),
+          'gcs_motor_apache': ([1, 2, 3, 4, 5, 6], [0.07, 0.01, 0.01, 0.03, 0.05, 0.83]),
+          'gcs_verbal_apache': ([1, 2, 3, 4, 5], [0.18, 0.03, 0.03, 0.13, 0.63])}
+
+# Prevalence of the binary flags
+PREVALENCES = {'elective_surgery': 0.18, 'readmission_status': 0.0, 'apache_post_operative': 0.2, 'arf_apache': 0.03,
+               'gcs_unable_apache': 0.01, 'intubated_apache': 0.15, 'ventilated_apache': 0.33, 'aids': 0.001,
+               'cirrhosis': 0.016, 'diabetes_mellitus': 0.23, 'hepatic_failure': 0.013, 'immunosuppression': 0.026,
+               'leukemia': 0.007, 'lymphoma': 0.004, 'solid_tumor_with_metastasis': 0.021}
+
+# Vocabularies of the string variables, with their frequencies
+VOCABULARIES = {
+    'ethnicity': (['Caucasian', 'African American', 'Other/Unknown', 'Hispanic', 'Asian', 'Native American'],
+                  [0.78, 0.10, 0.05, 0.04, 0.02, 0.01]),
+    'gender': (['M', 'F'], [0.54, 0.46]),
+    'hospital_admit_source': (['Emergency Department', 'Operating Room', 'Floor', 'Direct Admit', 'Recovery Room',
+                               'Acute Care/Floor', 'Other Hospital', 'Step-Down Unit (SDU)', 'PACU', 'Other ICU',
+                               'Chest Pain Center', 'ICU to SDU', 'ICU', 'Observation', 'Other'],
+                              [0.52, 0.13, 0.11, 0.07, 0.04, 0.02, 0.03, 0.02, 0.02, 0.01, 0.01, 0.005, 0.005, 0.005, 0.005]),
+    'icu_admit_source': (['Accident & Emergency', 'Operating Room / Recovery', 'Floor', 'Other Hospital', 'Other ICU'],
+                         [0.59, 0.20, 0.17, 0.03, 0.01]),
+    'icu_admit_type': (['Medical', 'Surgical', 'Cardiothoracic', 'Neurological', 'Trauma'], [0.6, 0.2, 0.1, 0.06, 0.04]),
+    'icu_stay_type': (['admit', 'transfer', 'readmit'], [0.95, 0.049, 0.001]),
+    'icu_type': (['Med-Surg ICU', 'MICU', 'Neuro ICU', 'CCU-CTICU', 'SICU', 'Cardiac ICU', 'CSICU', 'CTICU'],
+                 [0.55, 0.08, 0.08, 0.08, 0.06, 0.06, 0.05, 0.04]),
+    'apache_3j_bodysystem': (['Cardiovascular', 'Neurological', 'Sepsis', 'Respiratory', 'Gastrointestinal', 'Metabolic',
+                              'Trauma', 'Genitourinary', 'Musculoskeletal/Skin', 'Hematological', 'Gynecological'],
+                             [0.32, 0.13, 0.13, 0.13, 0.10, 0.08, 0.04, 0.025, 0.013, 0.007, 0.005]),
+    'apache_2_bodysystem': (['Cardiovascular', 'Neurologic', 'Respiratory', 'Gastrointestinal', 'Metabolic', 'Trauma',
+                             'Undefined diagnoses', 'Renal/Genitourinary', 'Haematologic', 'Undefined Diagnoses'],
+                            [0.42, 0.13, 0.13, 0.10, 0.08, 0.04, 0.04, 0.03, 0.007, 0.003]),
+}
+
+# Diagnosis codes, stored as numbers in the dataset: number of codes and their range
+DIAGNOSES = {'apache_2_diagnosis': (44, 101, 308), 'apache_3j_diagnosis': (400, 0.01, 2201.05)}
+
+# Missing rates, by the first matching pattern on the variable name
+MISSING_RATES = [
+    (r'^h1_.*_invasive_', 0.80), (r'^d1_.*_invasive_', 0.73),
+    (r'^h1_(arterial|pao2fio2)', 0.83), (r'^d1_(arterial|pao2fio2)', 0.65),
+    (r'^h1_(albumin|bilirubin|inr|lactate)', 0.91), (r'^h1_temp', 0.24),
+    (r'^h1_(bun|calcium|creatinine|glucose|hco3|hemaglobin|hematocrit|platelets|potassium|sodium|wbc)', 0.82),
+    (r'^d1_(albumin|bilirubin)', 0.55), (r'^d1_(inr|lactate)', 0.68), (r'^d1_(calcium|hco3|platelets|potassium)', 0.14),
+    (r'^d1_(bun|creatinine|glucose|hemaglobin|hematocrit|sodium|wbc)', 0.11), (r'^d1_temp', 0.025),
+    (r'^h1_', 0.05), (r'^d1_', 0.005),
+    (r'^(albumin|bilirubin)_apache', 0.6), (r'^(fio2|paco2|paco2_for_ph|pao2|ph)_apache', 0.77),
+    (r'^urineoutput_apache', 0.53), (r'^(bun|creatinine|glucose|sodium|wbc|hematocrit)_apache', 0.2),
+    (r'^temp_apache', 0.045), (r'^gcs_', 0.011), (r'_apache$', 0.01),
+    (r'^apache_4a_', 0.087), (r'^apache_(2|3j)_', 0.018), (r'^age$', 0.046), (r'^height$', 0.016), (r'^weight$', 0.027),
+    (r'^ethnicity$', 0.015), (r'^gender$', 0.0003), (r'^hospital_admit_source$', 0.23), (r'^icu_admit_source$', 0.001),
+    (r'^(aids|cirrhosis|diabetes_mellitus|hepatic_failure|immunosuppression|leukemia|lymphoma|solid_tumor)', 0.008),
+]
+
+# Intercept and slope of the logit of hospital_death on the latent severity (prevalence of about 8.6%)
+TARGET_LOGIT = (-3.15, 1.5)
+
+
+# Function to get the measurement of a variable: its name without the d1_/h1_ prefix and the suffixes
+def measurement(name):
+    stem = re.sub(r'^(d1|h1)_', '', name)
+    stem = re.sub(r'_(max|min)$', '', stem)
+    stem = re.sub(r'_(invasive|noninvasive)$', '', stem)
+    return re.sub(r'_apache$', '', stem)
+
+
+# Function to get the missing rate of a variable
+def missing_rate(name):
+    for pattern, rate in MISSING_RATES:
+        if re.search(pattern, name):
+            return rate
+    return 0.0
+
+
+# Function to describe how each variable of the data dictionary is generated
+def variable_specs(dictionary = None):
+    dictionary = load_dictionary() if dictionary is None else dictionary
+    dtypes = schema_dtypes(dictionary)
+    specs = []
+    for category, name in zip(dictionary['Category'], dictionary['Variable Name']):
+        if category == 'GOSSIS example prediction':
+            continue
+        stem = measurement(name)
+        if category == 'identifier' or name == 'icu_id':
+            kind = 'identifier'
+        elif name == TARGET:
+            kind = 'target'
+        elif name in SCORES:
+            kind = 'score'
+        elif name in DIAGNOSES:
+            kind = 'diagnosis'
+        elif dtypes[name] == 'Int8':
+            kind = 'binary'
+        elif dtypes[name] == 'category':
+            kind = 'string'
+        elif name == 'bmi':
+            kind = 'bmi'
+        elif name.startswith('apache_4a_'):
+            kind = 'probability'
+        else:
+            kind = 'numeric'
+        # Minimum and maximum of a measurement are taken (or missing) together
+        group = re.sub(r'_(max|min)$', '', name)
+        specs.append({'name': name, 'category': category, 'kind': kind, 'measurement': stem, 'group': group,
+                      'missing_rate': 0.0 if kind in ['identifier', 'target'] else missing_rate(name),
+                      'dtype': dtypes[name]})
+    specs = pd.DataFrame(specs).set_index('name')
+    unknown = specs.index[(specs['kind'] == 'numeric') & ~specs['measurement'].isin(list(MEASUREMENTS))]
+    if len(unknown) > 0:
+        raise ValueError(f"No measurement is defined for the variables {unknown.tolist()}")
+    return specs
+
+
+# Function to draw a numeric measurement, in float64, shifted by the severity
+def _draw_measurement(stem, severity, rng, size):
+    distribution, centre, spread, low, high, loading = MEASUREMENTS[stem]
+    z = rng.standard_normal(size) + loading*severity
+    values = centre*np.exp(spread*z) if distribution == 'lognormal' else centre + spread*z
+    return values, (distribution, centre, spread, low, high)
+
+
+# Function to generate a chunk of encounters, in the dtypes of read_dataset
+def generate(rows, seed = 0, start_id = 0, specs = None):
+    specs = variable_specs() if specs is None else specs
+    rng = np.random.default_rng(seed)
+    severity = rng.standard_normal(rows)
+    logit = TARGET_LOGIT[0] + TARGET_LOGIT[1]*severity
+    columns = {}
+
+    # Missingness shared by the columns of a group
+    missing = {group: rng.random(rows) < rate for group, rate in specs.groupby('group', sort = False)['missing_rate'].max().items()}
+
+    for name, spec in specs.iterrows():
+        kind = spec['kind']
+        if kind == 'identifier':
+            ranges = {'encounter_id': None, 'patient_id': None, 'hospital_id': 204, 'icu_id': 1111}
+            if ranges.get(name) is None:
+                values = np.arange(start_id, start_id + rows, dtype = np.int64) + (0 if name == 'encounter_id' else 10**8)
+            else:
+                values = rng.integers(1, ranges[name] + 1, size = rows)
+        elif kind == 'target':
+            values = (rng.random(rows) < 1/(1 + np.exp(-logit))).astype(np.float64)
+        elif kind == 'binary':
+            prevalence = PREVALENCES.get(name, 0.05)
+            values = (rng.random(rows) < prevalence).astype(np.float64)
+        elif kind == 'score':
+            levels, probabilities = SCORES[name]
+            # Sicker patients have lower GCS components: shift the uniform draw by the severity
+            u = np.clip(rng.random(rows) - 0.1*severity, 0, 1 - 1e-12)
+            values = np.asarray(levels, dtype = np.float64)[np.searchsorted(np.cumsum(probabilities), u, side = 'right')]
+        elif kind == 'diagnosis':
+            n_codes, low, high = DIAGNOSES[name]
+            codes = np.round(np.linspace(low, high, n_codes), 2)
+            weights = 1/np.arange(1, n_codes + 1) # Zipf-like frequencies
+            values = codes[rng.choice(n_codes, size = rows, p = weights/weights.sum())]
+        elif kind == 'string':
+            vocabulary, probabilities = VOCABULARIES[name]
+            probabilities = np.asarray(probabilities)/np.sum(probabilities)
+            values = pd.Categorical.from_codes(rng.choice(len(vocabulary), size = rows, p = probabilities), categories = vocabulary)
+            values = values.astype(object)
+        elif kind == 'probability':
+            noise = 0.6 if name.endswith('hospital_death_prob') else 0.7
+            values = np.round(1/(1 + np.exp(-(logit + noise*rng.standard_normal(rows)))), 2)
+            if name.endswith('icu_death_prob'):
+                values = np.round(values*0.75, 2)
+        elif kind == 'bmi':
+            values = None # Computed from the weight and height below
+        else:
+            values = None # Measurements are drawn per group below
+        columns[name] = values
+
+    # Measurements: one draw per group; the minimum and the maximum bracket it
+    numeric = specs[specs['kind'] == 'numeric']
+    for group, members in numeric.groupby('group', sort = False):
+        base, (distribution, centre, spread, low, high) = _draw_measurement(members['measurement'].iloc[0], severity, rng, rows)
+        width = 0.5 if group.startswith('d1_') else 0.15 # Range of a day against that of the first hour
+        for name in members.index:
+            jitter = width*np.abs(rng.standard_normal(rows))
+            if name.endswith('_max'):
+                values = base*np.exp(spread*jitter) if distribution == 'lognormal' else base + spread*jitter
+            elif name.endswith('_min'):
+                values = base*np.exp(-spread*jitter) if distribution == 'lognormal' else base - spread*jitter
+            else:
+                values = base
+            columns[name] = np.clip(values, low, high) # Clipping keeps the minimum below the maximum
+
+    if 'bmi' in specs.index:
+        columns['bmi'] = columns['weight']/(columns['height']/100)**2
+
+    # Missing values, shared within each group
+    df = pd.DataFrame(columns)
+    for name, spec in specs.iterrows():
+        mask = missing[spec['group']]
+        if name == 'bmi':
+            mask = mask | missing.get('weight', False) | missing.get('height', False)
+        if mask.any():
+            df.loc[mask, name] = np.nan if spec['kind'] != 'string' else None
+
+    # Schema dtypes, as read_dataset assigns them
+    for name, dtype in specs['dtype'].items():
+        if dtype == 'Int8':
+            df[name] = df[name].astype('int8' if not df[name].isna().any() else 'Int8')
+        else:
+            df[name] = df[name].astype(dtype)
+    return df
+
+
+# Function to generate a dataset chunk by chunk; every chunk has its own seed, spawned from the seed of the dataset
+def iter_synthetic(rows, chunksize = 100000, seed = 0, specs = None):
+    specs = variable_specs() if specs is None else specs
+    n_chunks = -(-rows//chunksize)
+    for i, chunk_seed in enumerate(np.random.SeedSequence(seed).spawn(n_chunks)):
+        yield generate(min(chunksize, rows - i*chunksize), seed = chunk_seed, start_id = i*chunksize, specs = specs)
+
+
+# Function to write a synthetic dataset to CSV, one chunk at a time
+def write_csv(path, rows, chunksize = 100000, seed = 0):
+    tmp = path + '.tmp'
+    deaths = 0
+    for i, chunk in enumerate(iter_synthetic(rows, chunksize = chunksize, seed = seed)):
+        chunk.to_csv(tmp, mode = 'w' if i == 0 else 'a', header = i == 0, index = False)
+        deaths += int(chunk[TARGET].sum())
+    os.replace(tmp, path)
+    return deaths/rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Generate a synthetic GOSSIS-shaped dataset from the data dictionary.')
+    parser.add_argument('output', nargs = '?', default = 'content/Synthetic.csv')
+    parser.add_argument('--rows', type = int, default = 100000)
+    parser.add_argument('--chunksize', type = int, default = 100000)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    prevalence = write_csv(args.output, args.rows, chunksize = args.chunksize, seed = args.seed)
+    print(pd.Series({"Rows": args.rows,
+                     "Columns": len(variable_specs()),
+                     "Proportion of hospital deaths": "{:.4f}".format(prevalence),
+                     "File size": "{:.1f} MB".format(os.path.getsize(args.output)/(1024*1024)),
+                     "Generation time": "{:.2f} seconds".format(time.perf_counter() - start)}).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Single-run training that keeps the weights of the best epoch.
+
+Section 5 used to train the tuned network for 50 epochs only to find the epoch of
+maximum validation accuracy, and then to retrain a fresh network from scratch for that
+many epochs. ``BestEpochWeights`` instead keeps a copy of the weights of the best epoch
+seen so far (in memory, or in a checkpoint file), optionally stops once the monitored
+metric has not improved for ``patience`` epochs, and restores those weights at the end
+of training. The best epoch is the first one reaching the best value, as
+``list.index(max(...))`` picks it.
+"""
+
+import numpy as np
+from tensorflow import keras
+
+
+class BestEpochWeights(keras.callbacks.Callback):
+
+    def __init__(self, monitor = 'val_accuracy', mode = 'max', patience = None, checkpoint_path = None):
+        super().__init__()
+        if mode not in ['max', 'min']:
+            raise ValueError(f"'{mode}' is not a valid argument for the parameter mode. Use 'max' or 'min'.")
+        self.monitor = monitor
+        self.mode = mode
+        self.patience = patience
+        self.checkpoint_path = checkpoint_path # Keras requires the suffix '.weights.h5'
+
+    def on_train_begin(self, logs = None):
+        self.best = -np.inf if self.mode == 'max' else np.inf
+        self.best_epoch = None
+        self.best_weights = None
+        self.wait = 0
+
+    def on_epoch_end(self, epoch, logs = None):
+        value = (logs or {}).get(self.monitor)
+        if value is None:
+            raise KeyError(f"The metric '{self.monitor}' is not logged; available metrics: {sorted(logs or {})}")
+        improved = value > self.best if self.mode == 'max' else value < self.best
+        if improved:
+            self.best, self.best_epoch, self.wait = value, epoch + 1, 0
+            if self.checkpoint_path is not None:
+                self.model.save_weights(self.checkpoint_path)
+            else:
+                self.best_weights = self.model.get_weights()
+        else:
+            self.wait += 1
+            if self.patience is not None and self.wait >= self.patience:
+                self.model.stop_training = True
+
+    def on_train_end(self, logs = None):
+        if self.checkpoint_path is not None and self.best_epoch is not None:
+            self.model.load_weights(self.checkpoint_path)
+        elif self.best_weights is not None:
+            self.model.set_weights(self.best_weights)
+
+
+# Function to train a model once and restore the weights of its best epoch; returns the model, the history and the best epoch
+def train_best_epoch(model, train, validation_data, epochs = 50, monitor = 'val_accuracy', mode = 'max',
+                     patience = None, checkpoint_path = None, callbacks = None, **kwargs):
+    best_weights = BestEpochWeights(monitor = monitor, mode = mode, patience = patience, checkpoint_path = checkpoint_path)
+    history = model.fit(train, validation_data = validation_data, epochs = epochs,
+                        callbacks = list(callbacks or []) + [best_weights], **kwargs)
+    return model, history, best_weights.best_epoch
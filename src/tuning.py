@@ -0,0 +1,196 @@
+"""Parallel Hyperband search on the cores of one machine.
+
+The search of section 5 is run with the distributed mode of Keras Tuner on localhost:
+a chief process hosts the Hyperband oracle, and a pool of worker processes, each
+pinned to its own slice of cores and limited to a TensorFlow thread budget, pull
+trials from it. All processes share the on-disk results directory, so an interrupted
+search resumes where it stopped when it is run again (unless --overwrite is given).
+
+    python -m src.tuning content/Dataset.csv --workers 4 --compare-serial
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import time
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from .cache import CACHE_DIR, load_clean_dataset
+from .ingestion import column_groups
+from .preprocessing import PreprocessingPipeline
+
+
+# Function to prepare the preprocessed training set of the notebook from the (cached) cleaned dataset
+def prepare_training_set(data_path, test_size = 0.2, random_state = 0, cache_dir = CACHE_DIR):
+    data = load_clean_dataset(data_path, cache_dir = cache_dir)
+    X = data.drop('hospital_death', axis = 1)
+    y = data['hospital_death']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size = test_size, shuffle = True, random_state = random_state)
+    preprocessor = PreprocessingPipeline(cols_object = column_groups(X)[2], random_state = random_state).fit(X_train)
+    return preprocessor.transform(X_train), y_train.to_numpy(dtype = np.float32), preprocessor
+
+
+# Function to limit the threads (and, where supported, the cores) a process runs TensorFlow on
+def limit_threads(threads, cpus = None):
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+# Entry point of the chief, the workers and the serial search (run in a spawned process)
+def _run_tuner(tuner_id, port, data_dir, threads, cpus, directory, project_name, max_epochs, factor, epochs, seed):
+    if tuner_id is not None:
+        os.environ['KERASTUNER_TUNER_ID'] = tuner_id
+        os.environ['KERASTUNER_ORACLE_IP'] = '127.0.0.1'
+        os.environ['KERASTUNER_ORACLE_PORT'] = str(port)
+    if threads is not None:
+        limit_threads(threads, cpus)
+
+    import tensorflow as tf
+    import keras_tuner as kt
+    from .input_pipeline import fit_datasets
+    from .models import make_model_builder
+
+    X_train = np.load(os.path.join(data_dir, 'X_train.npy'), mmap_mode = 'r')
+    y_train = np.load(os.path.join(data_dir, 'y_train.npy'))
+    tuner = kt.Hyperband(make_model_builder(X_train.shape[1]),
+                         objective = 'val_accuracy',
+                         max_epochs = max_epochs,
+                         factor = factor,
+                         seed = seed,
+                         directory = directory,
+                         project_name = project_name)
+    stop_early = tf.keras.callbacks.EarlyStopping(monitor = 'val_loss', patience = 5)
+    # Converted to tensors once, and shared by all the trials of this process
+    train, validation = fit_datasets(X_train, y_train, validation_split = 0.2, seed = seed)
+    tuner.search(train, validation_data = validation, epochs = epochs, callbacks = [stop_early], verbose = 0)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Function to wait until the oracle of the chief accepts connections
+def _wait_for_oracle(port, chief, timeout = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline and chief.is_alive():
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout = 1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("The Hyperband oracle did not start")
+
+
+# Function to run the Hyperband search with a chief and a pool of workers; returns the wall-clock time
+def parallel_search(data_dir, directory, project_name, workers = None, threads_per_worker = None,
+                    max_epochs = 10, factor = 3, epochs = 50, seed = None):
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    workers = workers or len(cores)
+    threads_per_worker = threads_per_worker or max(1, len(cores)//workers)
+    context = mp.get_context('spawn') # TensorFlow is not fork-safe
+    port = _free_port()
+    args = (data_dir, directory, project_name, max_epochs, factor, epochs, seed)
+
+    start = time.perf_counter()
+    chief = context.Process(target = _run_tuner, args = ('chief', port, args[0], 1, None) + args[1:])
+    chief.start()
+    _wait_for_oracle(port, chief)
+    pool = []
+    for i in range(workers):
+        cpus = [cores[(i*threads_per_worker + k) % len(cores)] for k in range(threads_per_worker)]
+        pool.append(context.Process(target = _run_tuner, args = (f'tuner{i}', port, args[0], threads_per_worker, cpus) + args[1:]))
+        pool[-1].start()
+    for process in pool:
+        process.join()
+    chief.join(timeout = 60)
+    if chief.is_alive():
+        chief.terminate()
+    runtime = time.perf_counter() - start
+
+    failed = [process.exitcode for process in pool if process.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"{len(failed)} tuning worker(s) failed with exit codes {failed}")
+    return runtime
+
+
+# Function to run the same search in a single process, as tuner.search does in the notebook
+def serial_search(data_dir, directory, project_name, max_epochs = 10, factor = 3, epochs = 50, seed = None):
+    process = mp.get_context('spawn').Process(target = _run_tuner, args = (None, None, data_dir, None, None, directory,
+                                                                          project_name, max_epochs, factor, epochs, seed))
+    start = time.perf_counter()
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"The serial search failed with exit code {process.exitcode}")
+    return time.perf_counter() - start
+
+
+# Function to load the best hyperparameters recorded in a results directory
+def best_hyperparameters(data_dir, directory, project_name, max_epochs = 10, factor = 3, seed = None):
+    import keras_tuner as kt
+    from .models import make_model_builder
+    input_dim = np.load(os.path.join(data_dir, 'X_train.npy'), mmap_mode = 'r').shape[1]
+    tuner = kt.Hyperband(make_model_builder(input_dim), objective = 'val_accuracy', max_epochs = max_epochs,
+                         factor = factor, seed = seed, directory = directory, project_name = project_name)
+    return tuner.get_best_hyperparameters(num_trials = 1)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Parallel Hyperband search for the Dense network.')
+    parser.add_argument('data', nargs = '?', default = 'content/Dataset.csv')
+    parser.add_argument('--workers', type = int, default = None, help = 'defaults to one per core')
+    parser.add_argument('--threads-per-worker', type = int, default = None)
+    parser.add_argument('--directory', default = 'dir_2')
+    parser.add_argument('--project-name', default = 'hyperband')
+    parser.add_argument('--max-epochs', type = int, default = 10)
+    parser.add_argument('--factor', type = int, default = 3)
+    parser.add_argument('--epochs', type = int, default = 50)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--overwrite', action = 'store_true', help = 'start afresh instead of resuming')
+    parser.add_argument('--compare-serial', action = 'store_true', help = 'also time the single-process search')
+    args = parser.parse_args()
+
+    # The preprocessed training set is written once and memory-mapped by every worker
+    data_dir = os.path.join(args.directory, f'{args.project_name}_data')
+    if args.overwrite:
+        shutil.rmtree(os.path.join(args.directory, args.project_name), ignore_errors = True)
+        shutil.rmtree(data_dir, ignore_errors = True)
+    if not os.path.exists(os.path.join(data_dir, 'X_train.npy')):
+        os.makedirs(data_dir, exist_ok = True)
+        X_train, y_train, preprocessor = prepare_training_set(args.data, random_state = args.seed)
+        np.save(os.path.join(data_dir, 'X_train.npy'), X_train)
+        np.save(os.path.join(data_dir, 'y_train.npy'), y_train)
+        preprocessor.save(os.path.join(data_dir, 'preprocessor.pkl'))
+
+    search = dict(max_epochs = args.max_epochs, factor = args.factor, seed = args.seed)
+    parallel_time = parallel_search(data_dir, args.directory, args.project_name, workers = args.workers,
+                                    threads_per_worker = args.threads_per_worker, epochs = args.epochs, **search)
+    report = {"Parallel search": "{:.1f} seconds".format(parallel_time)}
+    if args.compare_serial:
+        serial_project = f'{args.project_name}_serial'
+        shutil.rmtree(os.path.join(args.directory, serial_project), ignore_errors = True)
+        serial_time = serial_search(data_dir, args.directory, serial_project, epochs = args.epochs, **search)
+        report["Serial search"] = "{:.1f} seconds".format(serial_time)
+        report["Speedup"] = "{:.2f}x".format(serial_time/parallel_time)
+
+    best_hparams = best_hyperparameters(data_dir, args.directory, args.project_name, **search)
+    report["Optimal number of units in the first densely-connected layer"] = best_hparams.get('units')
+    report["Optimal learning rate for the optimizer"] = best_hparams.get('learning_rate')
+    print(pd.Series(report).to_string())
+
+
+if __name__ == '__main__':
+    main()